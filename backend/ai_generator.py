@@ -1,13 +1,72 @@
+import asyncio
+import hashlib
 import json
 import logging
-from typing import Any, Dict, List, Optional
-
+import ssl
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import orjson
 from config import config
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Shared HTTP connection pools for all AIGenerator instances. Building a client
+# per generator means a fresh SSL context and a new TLS handshake per request;
+# one pooled client keeps connections to the API warm across requests. Pooled
+# connections belong to the event loop that opened them, so each loop (the
+# server's, or each asyncio.run() of an offline job) gets its own client.
+_SHARED_SSL = ssl.create_default_context()
+# Event loop -> its pooled client; an entry goes away with its loop
+_SHARED_HTTPX: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _shared_http_client() -> httpx.AsyncClient:
+    """Return the running event loop's pooled HTTP client, creating it if needed"""
+    loop = asyncio.get_running_loop()
+    client = _SHARED_HTTPX.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            verify=_SHARED_SSL,
+            limits=httpx.Limits(
+                max_keepalive_connections=32, max_connections=64, keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+        _SHARED_HTTPX[loop] = client
+    return client
+
+
+async def close_shared_http_client():
+    """Close the running event loop's HTTP connection pool (call on shutdown)"""
+    client = _SHARED_HTTPX.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# Shortest prompt prefix the OpenAI prompt cache will store
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count for English text (~4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class _ToolRun:
+    """What one request's tool calls produced: their sources, and any failure"""
+
+    sources: list = field(default_factory=list)
+    failed: bool = False
+
 
 class AIGenerator:
     """Handles interactions with OpenAI's GPT-4o-mini API for generating responses"""
@@ -53,19 +112,69 @@ GENERAL RESPONSE REQUIREMENTS:
 
 For general questions about programming concepts, definitions, or common knowledge, answer immediately from your training. Only use tools when specific course details are needed."""
 
+    # Approximate token length of the static prompt, computed once. The
+    # provider only caches prompt prefixes of at least PROMPT_CACHE_MIN_TOKENS.
+    _SYSTEM_PROMPT_TOKENS = _estimate_tokens(SYSTEM_PROMPT)
+
     def __init__(self, api_key: str, model: str):
-        self.client = OpenAI(api_key=api_key)
+        # Validated here rather than in Config so that code which never talks
+        # to OpenAI (ingestion, tests) does not need a key
+        if not api_key or not api_key.strip():
+            raise ValueError(
+                "OPENAI_API_KEY environment variable is required. "
+                "Please create a .env file with your OpenAI API key."
+            )
+        self._api_key = api_key
+        self._client: Optional[AsyncOpenAI] = None
+        self._client_http: Optional[httpx.AsyncClient] = None
+        if self._SYSTEM_PROMPT_TOKENS < PROMPT_CACHE_MIN_TOKENS:
+            logger.warning(
+                "System prompt is ~%d tokens, below the %d-token prompt cache "
+                "threshold; requests will not get cached-prefix pricing",
+                self._SYSTEM_PROMPT_TOKENS,
+                PROMPT_CACHE_MIN_TOKENS,
+            )
         self.model = model
 
         # Pre-build base API parameters
         self.base_params = {"model": self.model, "temperature": 0.0, "max_tokens": 800}
 
-    def generate_response(
+        # Exact-match response cache (LRU): key -> (response, sources, timestamp)
+        self._response_cache: OrderedDict[str, Tuple[str, list, float]] = OrderedDict()
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """API client over the running event loop's shared connection pool"""
+        http_client = _shared_http_client()
+        if self._client is None or self._client_http is not http_client:
+            self._client = AsyncOpenAI(api_key=self._api_key, http_client=http_client)
+            self._client_http = http_client
+        return self._client
+
+    async def warm_up(self):
+        """
+        Open a pooled connection to the API ahead of the first user request.
+
+        Completes DNS, TCP and TLS setup so the first query doesn't pay for
+        them. Any response (even an error status) leaves a warm connection
+        behind; network failures are logged and otherwise ignored.
+        """
+        try:
+            await _shared_http_client().head(
+                self.client.base_url.join("models"),
+                headers={"Authorization": f"Bearer {self.client.api_key}"},
+            )
+            logger.info("API connection pre-warmed")
+        except httpx.HTTPError as e:
+            logger.warning("API connection pre-warm failed: %s", e)
+
+    async def generate_response(
         self,
         query: str,
         conversation_history: Optional[str] = None,
         tools: Optional[List] = None,
         tool_manager=None,
+        use_cache: bool = True,
     ) -> str:
         """
         Generate AI response with optional tool usage and conversation context.
@@ -75,35 +184,213 @@ For general questions about programming concepts, definitions, or common knowled
             conversation_history: Previous messages for context
             tools: Available tools the AI can use (in OpenAI format)
             tool_manager: Manager to execute tools
+            use_cache: Whether an identical earlier response may be reused
 
         Returns:
             Generated response as string
         """
-
-        # Build system content efficiently
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
+        response_text, _ = await self.generate_response_with_sources(
+            query, conversation_history, tools, tool_manager, use_cache
         )
+        return response_text
 
-        # OpenAI requires system message as first message in array
-        messages = [
-            {"role": "system", "content": system_content},
-            {"role": "user", "content": query},
-        ]
+    async def generate_response_with_sources(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+        use_cache: bool = True,
+    ) -> Tuple[str, list]:
+        """
+        Generate a response as generate_response() does, with its sources.
+
+        Sources are collected from this call's own tool executions rather than
+        read back from the shared tools, so concurrent requests never see each
+        other's sources.
+
+        Returns:
+            Tuple of (response text, sources from the tools used for it)
+        """
+        # Only stateless turns are cacheable - history makes every turn unique
+        cache_key = None
+        if use_cache and not conversation_history and config.RESPONSE_CACHE_SIZE > 0:
+            cache_key = self._response_cache_key(query, tools)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                response_text, sources, created = cached
+                if time.monotonic() - created < config.RESPONSE_CACHE_TTL:
+                    logger.debug("Response cache hit")
+                    self._response_cache.move_to_end(cache_key)
+                    return response_text, list(sources)
+                del self._response_cache[cache_key]
+
+        # OpenAI requires system message as first message in array. The static
+        # prompt is sent on its own so the request prefix is identical across
+        # calls and qualifies for provider-side prompt caching.
+        messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        if conversation_history:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Previous conversation:\n{conversation_history}",
+                }
+            )
+        messages.append({"role": "user", "content": query})
 
         # If tools are available, use the tool calling loop
+        tool_run = _ToolRun()
         if tools and tool_manager:
             logger.debug("Tools available, using tool calling loop")
-            return self._execute_tool_calling_loop(messages, tools, tool_manager)
+            response_text = await self._execute_tool_calling_loop(
+                messages, tools, tool_manager, tool_run
+            )
+        else:
+            # No tools available - make simple API call
+            response = await self._make_api_call(messages, tools=None)
+            response_text = response.choices[0].message.content
+
+        # An answer built on a failed tool call is not worth replaying
+        if cache_key is not None and not tool_run.failed:
+            self._response_cache[cache_key] = (
+                response_text,
+                list(tool_run.sources),
+                time.monotonic(),
+            )
+            if len(self._response_cache) > config.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
 
-        # No tools available - make simple API call
-        response = self._make_api_call(messages, tools=None)
-        return response.choices[0].message.content
+        return response_text, tool_run.sources
+
+    async def generate_batch(self, queries: List[str]) -> List[str]:
+        """
+        Answer several independent, tool-free queries concurrently.
+
+        Chat Completions has no multi-prompt form, so each distinct query is
+        its own request; they run together over the shared connection pool,
+        and duplicates within the batch (or earlier cached answers) are
+        served without an extra call.
+
+        Args:
+            queries: Stateless user questions (no history, no tools)
+
+        Returns:
+            Responses in the same order as the queries
+        """
+        unique = list(dict.fromkeys(queries))
+        responses = await asyncio.gather(
+            *(self.generate_response(query) for query in unique)
+        )
+        by_query = dict(zip(unique, responses))
+        return [by_query[query] for query in queries]
+
+    async def submit_batch(self, queries: List[str]) -> str:
+        """
+        Submit tool-free, stateless queries to the OpenAI Batch API.
+
+        Batch jobs are billed at a discount and do not count against the
+        interactive rate limit, which suits offline evaluation and bulk jobs.
+
+        Args:
+            queries: User questions; each becomes one chat completion request
+
+        Returns:
+            The batch id, to be passed to collect_batch()
+        """
+        lines = [
+            orjson.dumps(
+                {
+                    "custom_id": f"q-{i}",
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        **self.base_params,
+                        "messages": [
+                            {"role": "system", "content": self.SYSTEM_PROMPT},
+                            {"role": "user", "content": query},
+                        ],
+                    },
+                }
+            )
+            for i, query in enumerate(queries)
+        ]
+        batch_file = await self.client.files.create(
+            file=("batch.jsonl", b"\n".join(lines)), purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        logger.info("Submitted batch %s with %d requests", batch.id, len(queries))
+        return batch.id
+
+    async def collect_batch(
+        self, batch_id: str, count: int, poll_interval: float = 30.0
+    ) -> List[Optional[str]]:
+        """
+        Wait for a batch to finish and return its responses in query order.
+
+        Args:
+            batch_id: Id returned by submit_batch()
+            count: Number of queries that were submitted
+            poll_interval: Seconds between status checks
 
-    def _make_api_call(
-        self, messages: List[Dict[str, Any]], tools: Optional[List] = None
+        Returns:
+            Response text per query, or None for requests that failed
+
+        Raises:
+            RuntimeError: If the batch fails, expires or is cancelled
+        """
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                break
+            if batch.status in ("failed", "expired", "cancelled"):
+                raise RuntimeError(f"Batch {batch_id} ended with status {batch.status}")
+            await asyncio.sleep(poll_interval)
+
+        responses: List[Optional[str]] = [None] * count
+        if not batch.output_file_id:
+            return responses
+
+        # Output lines are not guaranteed to follow input order
+        output = await self.client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = orjson.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                logger.warning("Batch request %s failed", result.get("custom_id"))
+                continue
+            index = int(result["custom_id"].removeprefix("q-"))
+            responses[index] = response["body"]["choices"][0]["message"]["content"]
+        return responses
+
+    async def generate_response_batch(
+        self, queries: List[str], poll_interval: float = 30.0
+    ) -> List[Optional[str]]:
+        """Answer queries through the Batch API, waiting for the job to finish"""
+        batch_id = await self.submit_batch(queries)
+        return await self.collect_batch(batch_id, len(queries), poll_interval)
+
+    def clear_response_cache(self):
+        """Drop all cached responses (e.g. after course content changes)"""
+        self._response_cache.clear()
+
+    def _response_cache_key(self, query: str, tools: Optional[List]) -> str:
+        """Build a cache key from everything that determines a stateless response"""
+        payload = json.dumps(
+            [self.SYSTEM_PROMPT, self.model, query, tools or []], sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    async def _make_api_call(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List] = None,
+        stream: bool = False,
     ):
         """
         Make an OpenAI API call with given messages and optional tools.
@@ -111,9 +398,10 @@ For general questions about programming concepts, definitions, or common knowled
         Args:
             messages: List of message dictionaries to send to the API
             tools: Optional list of tool definitions
+            stream: Whether to request a streamed response
 
         Returns:
-            OpenAI API response object
+            OpenAI API response object (an async chunk stream if stream=True)
 
         Raises:
             Exception: If API call fails
@@ -123,21 +411,28 @@ For general questions about programming concepts, definitions, or common knowled
         if tools:
             api_params["tools"] = tools
             api_params["tool_choice"] = "auto"
-            logger.debug(f"Making API call with {len(tools)} tools available")
+            logger.debug("Making API call with %d tools available", len(tools))
         else:
             logger.debug("Making API call without tools")
 
+        if stream:
+            api_params["stream"] = True
+
         try:
-            response = self.client.chat.completions.create(**api_params)
-            logger.debug(
-                f"API call successful, finish_reason: {response.choices[0].finish_reason}"
-            )
+            response = await self.client.chat.completions.create(**api_params)
+            if stream:
+                logger.debug("API call successful, streaming response")
+            else:
+                logger.debug(
+                    "API call successful, finish_reason: %s",
+                    response.choices[0].finish_reason,
+                )
             return response
         except Exception as e:
-            logger.error(f"API call failed: {e}")
+            logger.error("API call failed: %s", e)
             raise
 
-    def _make_final_api_call(self, messages: List[Dict[str, Any]]) -> str:
+    async def _make_final_api_call(self, messages: List[Dict[str, Any]]) -> str:
         """
         Make final API call without tools and return text response.
 
@@ -151,11 +446,15 @@ For general questions about programming concepts, definitions, or common knowled
             Exception: If API call fails
         """
         logger.debug("Making final API call (no tools)")
-        response = self._make_api_call(messages, tools=None)
+        response = await self._make_api_call(messages, tools=None)
         return response.choices[0].message.content
 
-    def _execute_tool_calling_loop(
-        self, messages: List[Dict[str, Any]], tools: List, tool_manager
+    async def _execute_tool_calling_loop(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List,
+        tool_manager,
+        tool_run: _ToolRun,
     ) -> str:
         """
         Execute tool calling loop supporting up to MAX_TOOL_ROUNDS sequential rounds.
@@ -164,12 +463,14 @@ For general questions about programming concepts, definitions, or common knowled
         1. Make API call with tools available
         2. If Claude requests tools, execute them and add results to messages
         3. Repeat until Claude stops calling tools or max rounds reached
-        4. Make final API call without tools to get synthesized response
+        4. If the last allowed round still called tools, make a final API call
+           without tools so the model can synthesize their results
 
         Args:
             messages: Initial message history (system + user query)
             tools: List of available tool definitions
             tool_manager: Manager to execute tools
+            tool_run: Collects the sources and failures of every tool executed
 
         Returns:
             Final synthesized response text
@@ -178,37 +479,59 @@ For general questions about programming concepts, definitions, or common knowled
             Exception: If any API call fails
         """
         max_rounds = config.MAX_TOOL_ROUNDS
-        logger.info(f"Starting tool calling loop (max {max_rounds} rounds)")
+        logger.info("Starting tool calling loop (max %d rounds)", max_rounds)
 
         for round_num in range(max_rounds):
             logger.debug(
-                f"Tool round {round_num + 1}/{max_rounds}: Making API call with tools"
+                "Tool round %d/%d: Making API call with tools",
+                round_num + 1,
+                max_rounds,
             )
 
-            # Make API call with tools available
-            response = self._make_api_call(messages, tools)
-
-            # Check if Claude wants to use tools
-            if response.choices[0].finish_reason != "tool_calls":
-                logger.info(f"Claude responded without tools after {round_num} rounds")
-                return response.choices[0].message.content
-
-            # Execute tools and update message history
-            logger.info(f"Tool calls detected in round {round_num + 1}")
-            messages, _ = self._execute_single_tool_round(
-                response, messages, tool_manager
-            )
+            if config.STREAM_TOOL_CALLS:
+                # Tools start executing while the rest of the response streams in
+                answered, response_text = await self._execute_streaming_tool_round(
+                    messages, tools, tool_manager, tool_run
+                )
+                if answered:
+                    logger.info(
+                        "Claude responded without tools after %d rounds", round_num
+                    )
+                    return response_text
+            else:
+                # Make API call with tools available
+                response = await self._make_api_call(messages, tools)
+
+                # Check if Claude wants to use tools
+                if response.choices[0].finish_reason != "tool_calls":
+                    logger.info(
+                        "Claude responded without tools after %d rounds", round_num
+                    )
+                    return response.choices[0].message.content
+
+                # Execute tools and update message history
+                logger.info("Tool calls detected in round %d", round_num + 1)
+                messages, _ = await self._execute_single_tool_round(
+                    response, messages, tool_manager, tool_run
+                )
 
-            logger.info(f"Completed tool round {round_num + 1}/{max_rounds}")
+            logger.info("Completed tool round %d/%d", round_num + 1, max_rounds)
 
-        # Max rounds reached - make final call without tools
+        # Max rounds reached. Every round that gets here ended in tool calls, so
+        # the model has not yet seen the latest results and any content in the
+        # last response predates them; a round that answered directly already
+        # returned above without this extra call.
         logger.info(
-            f"Max tool rounds ({max_rounds}) reached, making final synthesis call"
+            "Max tool rounds (%d) reached, making final synthesis call", max_rounds
         )
-        return self._make_final_api_call(messages)
+        return await self._make_final_api_call(messages)
 
-    def _execute_single_tool_round(
-        self, api_response, messages: List[Dict[str, Any]], tool_manager
+    async def _execute_single_tool_round(
+        self,
+        api_response,
+        messages: List[Dict[str, Any]],
+        tool_manager,
+        tool_run: _ToolRun,
     ) -> tuple[List[Dict[str, Any]], bool]:
         """
         Execute tools from a single API response and update message history.
@@ -217,79 +540,230 @@ For general questions about programming concepts, definitions, or common knowled
             api_response: The API response containing tool calls
             messages: Current message history to append to
             tool_manager: Manager to execute tools
+            tool_run: Collects the sources and failures of the executed tools
 
         Returns:
             Tuple of (updated_messages, should_continue)
             - updated_messages: Message list with assistant message and tool results
             - should_continue: True if API response indicates more tool calls possible
         """
-        # Add AI's tool use response (entire message object)
+        # Add AI's tool use response (entire message object), serialized by the
+        # SDK in exactly the shape the API accepts back
         assistant_message = api_response.choices[0].message
+        messages.append(
+            assistant_message.model_dump(exclude_none=True, exclude={"function_call"})
+        )
+
+        # Execute all tool calls concurrently - a round completes in the time
+        # of its slowest tool instead of the sum of all of them
+        results = await asyncio.gather(
+            *(
+                self._execute_tool_call(tool_call, tool_manager)
+                for tool_call in assistant_message.tool_calls
+            )
+        )
+
+        # Add tool result messages in the order the tools were requested
+        self._append_tool_results(
+            messages, assistant_message.tool_calls, results, tool_run
+        )
+
+        # Return updated messages and signal to continue (more rounds possible)
+        return messages, True
+
+    @staticmethod
+    def _append_tool_results(
+        messages: List[Dict[str, Any]],
+        tool_calls: List,
+        results: List[Tuple[str, list, bool]],
+        tool_run: _ToolRun,
+    ):
+        """Append one tool message per call and collect the calls' outcomes"""
+        for tool_call, (tool_result, sources, failed) in zip(tool_calls, results):
+            tool_run.sources.extend(sources)
+            tool_run.failed |= failed
+            messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "name": tool_call.function.name,
+                    "content": tool_result,
+                }
+            )
+
+    async def _execute_streaming_tool_round(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List,
+        tool_manager,
+        tool_run: _ToolRun,
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Run one tool round over a streamed response, dispatching each tool call
+        as soon as its arguments are complete instead of after the whole message.
+
+        Args:
+            messages: Current message history to append to
+            tools: List of available tool definitions
+            tool_manager: Manager to execute tools
+            tool_run: Collects the sources and failures of the executed tools
+
+        Returns:
+            Tuple of (whether the model answered without tools, its response
+            text). When it called tools instead, messages are extended with the
+            assistant message and tool results and the text is None.
+        """
+        stream = await self._make_api_call(messages, tools, stream=True)
+
+        tool_calls: Dict[int, SimpleNamespace] = {}
+        tasks: Dict[int, asyncio.Task] = {}
+
+        def dispatch_pending():
+            for index, tool_call in tool_calls.items():
+                if index not in tasks:
+                    tasks[index] = asyncio.create_task(
+                        self._execute_tool_call(tool_call, tool_manager)
+                    )
+
+        try:
+            content, finish_reason = await self._read_tool_stream(
+                stream, tool_calls, dispatch_pending
+            )
+        except BaseException:
+            self._cancel_tasks(tasks)
+            raise
+
+        if finish_reason != "tool_calls":
+            # Calls dispatched early are moot once the model answers directly
+            self._cancel_tasks(tasks)
+            return True, content
+
+        logger.info("Streamed %d tool calls", len(tool_calls))
+        dispatch_pending()
+        indexes = sorted(tool_calls)
+        results = await asyncio.gather(*(tasks[index] for index in indexes))
+        ordered = [tool_calls[index] for index in indexes]
+
         messages.append(
             {
                 "role": "assistant",
-                "content": assistant_message.content,
+                "content": content,
                 "tool_calls": [
                     {
-                        "id": tc.id,
-                        "type": tc.type,
+                        "id": tool_call.id,
+                        "type": "function",
                         "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments,
+                            "name": tool_call.function.name,
+                            "arguments": tool_call.function.arguments,
                         },
                     }
-                    for tc in assistant_message.tool_calls
+                    for tool_call in ordered
                 ],
             }
         )
+        self._append_tool_results(messages, ordered, results, tool_run)
+        return False, None
 
-        # Execute all tool calls and collect results
-        for tool_call in assistant_message.tool_calls:
-            tool_name = tool_call.function.name
-            logger.info(f"Executing tool: {tool_name}")
-
-            # Parse JSON arguments
-            try:
-                arguments = json.loads(tool_call.function.arguments)
-                logger.debug(f"Tool arguments parsed: {arguments}")
-            except json.JSONDecodeError as e:
-                error_msg = f"Failed to parse tool arguments for {tool_name}: {e}"
-                logger.error(error_msg)
-                logger.error(f"Raw arguments string: {tool_call.function.arguments}")
-                # Return error as tool result instead of silently failing
-                tool_result = f"Error: {error_msg}"
-                messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "name": tool_name,
-                        "content": tool_result,
-                    }
-                )
+    @classmethod
+    async def _read_tool_stream(
+        cls, stream, tool_calls: Dict[int, SimpleNamespace], dispatch_pending
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Consume a streamed response, assembling tool calls in place.
+
+        Args:
+            stream: Async iterator of chat completion chunks
+            tool_calls: Filled with the assembled tool calls, keyed by index
+            dispatch_pending: Called whenever the calls seen so far are complete
+
+        Returns:
+            Tuple of (text content or None, finish reason)
+        """
+        content_parts: List[str] = []
+        finish_reason = None
+        async for chunk in stream:
+            if not chunk.choices:
                 continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                content_parts.append(choice.delta.content)
+
+            for delta in choice.delta.tool_calls or []:
+                if delta.index not in tool_calls:
+                    # Tool calls stream one after another, so a new index
+                    # means every earlier call's arguments are complete
+                    dispatch_pending()
+                cls._apply_tool_call_delta(tool_calls, delta)
+
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+        return "".join(content_parts) or None, finish_reason
+
+    @staticmethod
+    def _apply_tool_call_delta(tool_calls: Dict[int, SimpleNamespace], delta):
+        """Merge one streamed tool call fragment into the call it belongs to"""
+        tool_call = tool_calls.get(delta.index)
+        if tool_call is None:
+            tool_call = tool_calls[delta.index] = SimpleNamespace(
+                id=delta.id,
+                type="function",
+                function=SimpleNamespace(name="", arguments=""),
+            )
+        if delta.id:
+            tool_call.id = delta.id
+        if delta.function:
+            tool_call.function.name += delta.function.name or ""
+            tool_call.function.arguments += delta.function.arguments or ""
+
+    @staticmethod
+    def _cancel_tasks(tasks: Dict[int, asyncio.Task]):
+        """Cancel tool calls that were dispatched but are no longer needed"""
+        for task in tasks.values():
+            task.cancel()
+
+    async def _execute_tool_call(
+        self, tool_call, tool_manager
+    ) -> Tuple[str, list, bool]:
+        """
+        Parse arguments for a single tool call and execute it off the event loop.
 
-            # Execute tool
-            try:
-                tool_result = tool_manager.execute_tool(tool_name, **arguments)
-                logger.info(f"Tool {tool_name} executed successfully")
-            except Exception as e:
-                logger.error(f"Tool {tool_name} execution failed: {e}")
-                tool_result = f"Error executing tool: {str(e)}"
+        Args:
+            tool_call: Tool call object from the API response
+            tool_manager: Manager to execute tools
 
-            # Add tool result message
-            messages.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "name": tool_call.function.name,
-                    "content": tool_result,
-                }
+        Returns:
+            Tuple of (tool result text, or an error message if parsing or
+            execution failed; sources the tool used; whether the call failed)
+        """
+        tool_name = tool_call.function.name
+        logger.info("Executing tool: %s", tool_name)
+
+        # Parse JSON arguments and check them against the tool's schema
+        try:
+            arguments = tool_manager.parse_and_validate(
+                tool_name, tool_call.function.arguments
             )
+            logger.debug("Tool arguments parsed: %s", arguments)
+        except ValueError as e:
+            error_msg = f"Failed to parse tool arguments for {tool_name}: {e}"
+            logger.error(error_msg)
+            logger.error("Raw arguments string: %s", tool_call.function.arguments)
+            # Return error as tool result instead of silently failing
+            return f"Error: {error_msg}", [], True
+
+        # Execute tool in a worker thread (vector search is blocking I/O)
+        try:
+            tool_result, sources, failed = await asyncio.to_thread(
+                tool_manager.execute_tool_with_sources, tool_name, **arguments
+            )
+            logger.info("Tool %s executed successfully", tool_name)
+        except Exception as e:
+            logger.error("Tool %s execution failed: %s", tool_name, e)
+            tool_result, sources, failed = f"Error executing tool: {str(e)}", [], True
 
-        # Return updated messages and signal to continue (more rounds possible)
-        return messages, True
+        return tool_result, sources, failed
 
-    def _handle_tool_execution(
+    async def _handle_tool_execution(
         self, initial_response, base_messages: List[Dict[str, Any]], tool_manager
     ):
         """
@@ -305,10 +779,10 @@ For general questions about programming concepts, definitions, or common knowled
             Final response text after tool execution
         """
         # Execute single round
-        messages, _ = self._execute_single_tool_round(
-            initial_response, base_messages.copy(), tool_manager
+        messages, _ = await self._execute_single_tool_round(
+            initial_response, base_messages.copy(), tool_manager, _ToolRun()
         )
 
         # Get final response without tools using helper method
         # Deliberately omit tools to prevent recursive calling
-        return self._make_final_api_call(messages)
+        return await self._make_final_api_call(messages)
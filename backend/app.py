@@ -9,16 +9,17 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
+import asyncio
 import os
-from typing import List, Optional
 
+from ai_generator import close_shared_http_client
 from config import config
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
 from rag_system import RAGSystem
+from schemas import CourseStats, QueryRequest, QueryResponse
 
 # Initialize FastAPI app
 app = FastAPI(title="Course Materials RAG System", root_path="")
@@ -39,37 +40,6 @@ app.add_middleware(
 # Initialize RAG system
 rag_system = RAGSystem(config)
 
-
-# Pydantic models for request/response
-class QueryRequest(BaseModel):
-    """Request model for course queries"""
-
-    query: str
-    session_id: Optional[str] = None
-
-
-class Source(BaseModel):
-    """Source with label and optional link"""
-
-    label: str
-    link: Optional[str] = None
-
-
-class QueryResponse(BaseModel):
-    """Response model for course queries"""
-
-    answer: str
-    sources: List[Source]
-    session_id: str
-
-
-class CourseStats(BaseModel):
-    """Response model for course statistics"""
-
-    total_courses: int
-    course_titles: List[str]
-
-
 # API Endpoints
 
 
@@ -85,7 +55,7 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
 
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        answer, sources = await rag_system.query(request.query, session_id)
 
         return QueryResponse(answer=answer, sources=sources, session_id=session_id)
     except ValueError as e:
@@ -118,6 +88,9 @@ async def get_course_stats():
 @app.on_event("startup")
 async def startup_event():
     """Load initial documents on startup"""
+    # Warm the API connection in the background, ahead of the first query
+    app.state.warm_up_task = asyncio.create_task(rag_system.ai_generator.warm_up())
+
     docs_path = "../docs"
     if os.path.exists(docs_path):
         print("Loading initial documents...")
@@ -130,6 +103,12 @@ async def startup_event():
             print(f"Error loading documents: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled HTTP connections on shutdown"""
+    await close_shared_http_client()
+
+
 import os
 from pathlib import Path
 
@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Config:
     """Configuration settings for the RAG system"""
 
@@ -15,14 +15,6 @@ class Config:
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = "gpt-4o-mini"
 
-    def __post_init__(self):
-        """Validate configuration after initialization."""
-        if not self.OPENAI_API_KEY or self.OPENAI_API_KEY.strip() == "":
-            raise ValueError(
-                "OPENAI_API_KEY environment variable is required. "
-                "Please create a .env file with your OpenAI API key."
-            )
-
     # Embedding model settings
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
 
@@ -34,9 +26,20 @@ class Config:
 
     # Tool calling settings
     MAX_TOOL_ROUNDS: int = 2  # Maximum sequential tool calling rounds per query
+    STREAM_TOOL_CALLS: bool = False  # Stream tool rounds, dispatching calls early
+
+    # Response caching settings
+    RESPONSE_CACHE_SIZE: int = 1024  # Cached stateless responses (0 disables)
+    RESPONSE_CACHE_TTL: int = 600  # Seconds before a cached response expires
+    SEMANTIC_CACHE_SIZE: int = 256  # Cached course searches (0 disables)
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # Min cosine similarity for a hit
+    SEMANTIC_CACHE_TTL: int = 600  # Seconds before a cached search expires
+    OUTLINE_CACHE_TTL: int = 600  # Seconds before a cached outline expires
+    EMBEDDING_CACHE_TTL: int = 86400  # Seconds to reuse an embedding (0 disables)
 
     # Database paths
     CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location
+    EMBEDDING_CACHE_PATH: str = "./embedding_cache.sqlite3"  # Query embedding cache
 
 
 config = Config()
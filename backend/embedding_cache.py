@@ -0,0 +1,91 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of text embeddings in a local SQLite file.
+
+    Entries are keyed by model and text and expire after ttl seconds; database
+    errors are logged and treated as misses.
+    """
+
+    def __init__(self, path: str, model_name: str, ttl: float = 86400.0):
+        self.model_name = model_name
+        self.ttl = ttl
+        # Searches run in worker threads, so share one connection under a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Writes happen on the query path after every miss; in WAL mode with
+        # synchronous=NORMAL a commit doesn't wait for an fsync. A crash can
+        # lose the latest entries, which is harmless for a cache.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._next_purge = 0.0
+        with self._conn:
+            self._purge_expired(time.time())
+
+    def _purge_expired(self, now: float):
+        """Delete expired rows; runs inside the caller's transaction"""
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE created <= ?", (now - self.ttl,)
+        )
+        self._next_purge = now + self.ttl
+
+    def _key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{text}".encode()
+        return hashlib.sha256(payload).hexdigest()[:32]
+
+    def get(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up embeddings for texts in one query; None marks a miss"""
+        keys = [self._key(text) for text in texts]
+        placeholders = ",".join("?" * len(keys))
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings "
+                    f"WHERE key IN ({placeholders}) AND created > ?",
+                    (*keys, time.time() - self.ttl),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache read failed: %s", e)
+            return [None] * len(texts)
+
+        found = {key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows}
+        return [found.get(key) for key in keys]
+
+    def set(self, texts: List[str], embeddings: List[np.ndarray]):
+        """Store embeddings for texts in a single transaction"""
+        now = time.time()
+        rows = [
+            (self._key(text), np.asarray(emb, dtype=np.float32).tobytes(), now)
+            for text, emb in zip(texts, embeddings)
+        ]
+        try:
+            with self._lock, self._conn:
+                if now >= self._next_purge:
+                    self._purge_expired(now)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows
+                )
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache write failed: %s", e)
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
@@ -3,6 +3,7 @@ from typing import Dict, List, Optional, Tuple
 
 from ai_generator import AIGenerator
 from document_processor import DocumentProcessor
+from embedding_cache import EmbeddingCache
 from models import Course, CourseChunk, Lesson
 from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
 from session_manager import SessionManager
@@ -19,17 +20,34 @@ class RAGSystem:
         self.document_processor = DocumentProcessor(
             config.CHUNK_SIZE, config.CHUNK_OVERLAP
         )
+        embedding_cache = None
+        if config.EMBEDDING_CACHE_TTL > 0:
+            embedding_cache = EmbeddingCache(
+                config.EMBEDDING_CACHE_PATH,
+                config.EMBEDDING_MODEL,
+                config.EMBEDDING_CACHE_TTL,
+            )
         self.vector_store = VectorStore(
-            config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
+            config.CHROMA_PATH,
+            config.EMBEDDING_MODEL,
+            config.MAX_RESULTS,
+            embedding_cache,
         )
         self.ai_generator = AIGenerator(config.OPENAI_API_KEY, config.OPENAI_MODEL)
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
         # Initialize search tools
         self.tool_manager = ToolManager()
-        self.search_tool = CourseSearchTool(self.vector_store)
+        self.search_tool = CourseSearchTool(
+            self.vector_store,
+            config.SEMANTIC_CACHE_SIZE,
+            config.SEMANTIC_CACHE_THRESHOLD,
+            config.SEMANTIC_CACHE_TTL,
+        )
         self.tool_manager.register_tool(self.search_tool)
-        self.outline_tool = CourseOutlineTool(self.vector_store)
+        self.outline_tool = CourseOutlineTool(
+            self.vector_store, config.OUTLINE_CACHE_TTL
+        )
         self.tool_manager.register_tool(self.outline_tool)
 
     def add_course_document(self, file_path: str) -> Tuple[Course, int]:
@@ -53,6 +71,7 @@ class RAGSystem:
 
             # Add course content chunks to vector store
             self.vector_store.add_course_content(course_chunks)
+            self._clear_caches()
 
             return course, len(course_chunks)
         except Exception as e:
@@ -79,6 +98,7 @@ class RAGSystem:
         if clear_existing:
             print("Clearing existing data for fresh rebuild...")
             self.vector_store.clear_all_data()
+            self._clear_caches()
 
         if not os.path.exists(folder_path):
             print(f"Folder {folder_path} does not exist")
@@ -115,9 +135,18 @@ class RAGSystem:
                 except Exception as e:
                     print(f"Error processing {file_name}: {e}")
 
+        # Cached searches and answers may be missing the newly added content
+        if total_courses:
+            self._clear_caches()
+
         return total_courses, total_chunks
 
-    def query(
+    def _clear_caches(self):
+        """Drop cached searches and answers that may predate a content change"""
+        self.search_tool.clear_cache()
+        self.ai_generator.clear_response_cache()
+
+    async def query(
         self, query: str, session_id: Optional[str] = None
     ) -> Tuple[str, List[str]]:
         """
@@ -138,20 +167,16 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
 
-        # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
+        # Generate response using AI with tools. Sources come back with the
+        # response rather than from the shared tools, which other requests
+        # running at the same time also write to
+        response, sources = await self.ai_generator.generate_response_with_sources(
             query=prompt,
             conversation_history=history,
             tools=self.tool_manager.get_tool_definitions(),
             tool_manager=self.tool_manager,
         )
 
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
-
         # Update conversation history
         if session_id:
             self.session_manager.add_exchange(session_id, query, response)
@@ -0,0 +1,33 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+# Pydantic models for request/response
+class QueryRequest(BaseModel):
+    """Request model for course queries"""
+
+    query: str
+    session_id: Optional[str] = None
+
+
+class Source(BaseModel):
+    """Source with label and optional link"""
+
+    label: str
+    link: Optional[str] = None
+
+
+class QueryResponse(BaseModel):
+    """Response model for course queries"""
+
+    answer: str
+    sources: List[Source]
+    session_id: str
+
+
+class CourseStats(BaseModel):
+    """Response model for course statistics"""
+
+    total_courses: int
+    course_titles: List[str]
@@ -1,7 +1,12 @@
+import json
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, Protocol
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
 
+import numpy as np
+import orjson
 from vector_store import SearchResults, VectorStore
 
 # Set up logging
@@ -21,14 +26,33 @@ class Tool(ABC):
         """Execute the tool with given parameters"""
         pass
 
+    def execute_with_sources(self, **kwargs) -> Tuple[str, list, bool]:
+        """Execute the tool and return its result, sources and failure flag"""
+        return self.execute(**kwargs), [], False
+
 
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
 
-    def __init__(self, vector_store: VectorStore):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        cache_size: int = 0,
+        cache_threshold: float = 0.95,
+        cache_ttl: float = 600.0,
+    ):
         self.store = vector_store
         self.last_sources = []  # Track sources from last search
 
+        # Semantic cache of recent searches, least recently used first:
+        # (query embedding, filters, formatted result, sources, timestamp)
+        self.cache_size = cache_size
+        self.cache_threshold = cache_threshold
+        self.cache_ttl = cache_ttl
+        self._sem_cache: List[Tuple[np.ndarray, tuple, str, list, float]] = []
+        # Tool calls run in worker threads, so cache updates happen under a lock
+        self._cache_lock = threading.Lock()
+
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return OpenAI tool definition for this tool"""
         return {
@@ -62,7 +86,21 @@ class CourseSearchTool(Tool):
         query: str,
         course_name: Optional[str] = None,
         lesson_number: Optional[int] = None,
+        no_cache: bool = False,
     ) -> str:
+        """Execute the search tool, keeping its sources in last_sources"""
+        result, self.last_sources, _ = self.execute_with_sources(
+            query, course_name, lesson_number, no_cache
+        )
+        return result
+
+    def execute_with_sources(
+        self,
+        query: str,
+        course_name: Optional[str] = None,
+        lesson_number: Optional[int] = None,
+        no_cache: bool = False,
+    ) -> Tuple[str, list, bool]:
         """
         Execute the search tool with given parameters.
 
@@ -70,23 +108,44 @@ class CourseSearchTool(Tool):
             query: What to search for
             course_name: Optional course filter
             lesson_number: Optional lesson filter
+            no_cache: Skip the semantic cache and always query the store
 
         Returns:
-            Formatted search results or error message
+            Tuple of (formatted search results or error message, sources,
+            whether the search failed)
         """
         logger.info(
-            f"CourseSearchTool executing: query='{query}', course='{course_name}', lesson={lesson_number}"
+            "CourseSearchTool executing: query='%s', course='%s', lesson=%s",
+            query,
+            course_name,
+            lesson_number,
         )
 
+        # Serve near-duplicate queries with the same filters from the cache
+        search_kwargs = {}
+        filters = (course_name, lesson_number)
+        if self.cache_size > 0 and not no_cache:
+            query_embedding = self.store.embed(query)
+            cached = self._cache_lookup(query_embedding, filters)
+            if cached is not None:
+                logger.info("Semantic cache hit")
+                formatted, sources = cached
+                return formatted, list(sources), False
+            # Reuse the embedding so the store doesn't embed the query again
+            search_kwargs["query_embedding"] = query_embedding
+
         # Use the vector store's unified search interface
         results = self.store.search(
-            query=query, course_name=course_name, lesson_number=lesson_number
+            query=query,
+            course_name=course_name,
+            lesson_number=lesson_number,
+            **search_kwargs,
         )
 
         # Handle errors
         if results.error:
-            logger.error(f"Search error: {results.error}")
-            return results.error
+            logger.error("Search error: %s", results.error)
+            return results.error, [], True
 
         # Handle empty results
         if results.is_empty():
@@ -95,56 +154,107 @@ class CourseSearchTool(Tool):
                 filter_info += f" in course '{course_name}'"
             if lesson_number:
                 filter_info += f" in lesson {lesson_number}"
-            logger.warning(f"No results found{filter_info}")
-            return f"No relevant content found{filter_info}."
+            logger.warning("No results found%s", filter_info)
+            return f"No relevant content found{filter_info}.", [], False
 
         # Format and return results
-        logger.info(f"Found {len(results.documents)} results")
-        return self._format_results(results)
+        logger.info("Found %d results", len(results.documents))
+        formatted, sources = self._format_results(results)
+        if "query_embedding" in search_kwargs:
+            self._cache_store(
+                search_kwargs["query_embedding"], filters, formatted, sources
+            )
+        return formatted, sources, False
+
+    def _cache_lookup(
+        self, query_embedding: np.ndarray, filters: tuple
+    ) -> Optional[Tuple[str, list]]:
+        """Find a fresh cached result for a similar query with identical filters"""
+        now = time.monotonic()
+        with self._cache_lock:
+            self._sem_cache = [
+                entry for entry in self._sem_cache if now - entry[4] < self.cache_ttl
+            ]
 
-    def _format_results(self, results: SearchResults) -> str:
-        """Format search results with course and lesson context"""
+            for i, entry in enumerate(self._sem_cache):
+                embedding, entry_filters, formatted, sources, _ = entry
+                # Embeddings are L2-normalized, so the dot product is cosine similarity
+                if (
+                    entry_filters == filters
+                    and float(query_embedding @ embedding) >= self.cache_threshold
+                ):
+                    # Mark as most recently used
+                    self._sem_cache.append(self._sem_cache.pop(i))
+                    return formatted, sources
+        return None
+
+    def _cache_store(
+        self,
+        query_embedding: np.ndarray,
+        filters: tuple,
+        formatted: str,
+        sources: list,
+    ):
+        """Add a search result to the cache, evicting the least recently used"""
+        entry = (query_embedding, filters, formatted, sources, time.monotonic())
+        with self._cache_lock:
+            self._sem_cache.append(entry)
+            if len(self._sem_cache) > self.cache_size:
+                self._sem_cache.pop(0)
+
+    def clear_cache(self):
+        """Drop all cached search results (e.g. after new content is added)"""
+        with self._cache_lock:
+            self._sem_cache = []
+
+    def _format_results(self, results: SearchResults) -> Tuple[str, list]:
+        """Format search results with course and lesson context, and their sources"""
         formatted = []
         sources = []  # Track rich source objects for the UI
 
-        for doc, meta in zip(results.documents, results.metadata):
-            course_title = meta.get("course_title", "unknown")
-            lesson_num = meta.get("lesson_number")
-
-            # Build context header
-            header = f"[{course_title}"
-            if lesson_num is not None:
-                header += f" - Lesson {lesson_num}"
-            header += "]"
-
-            # Build source label
-            source_label = course_title
-            if lesson_num is not None:
-                source_label += f" - Lesson {lesson_num}"
-
-            # Retrieve lesson link from vector store
-            lesson_link = None
-            if lesson_num is not None:
-                lesson_link = self.store.get_lesson_link(course_title, lesson_num)
-
-            # Create rich source object with label and link
-            source_obj = {"label": source_label, "link": lesson_link}
-            sources.append(source_obj)
+        # Resolve every lesson link in a single vector store round-trip
+        entries = [
+            (meta.get("course_title", "unknown"), meta.get("lesson_number"))
+            for meta in results.metadata
+        ]
+        links = self.store.get_lesson_links_batch(
+            {entry for entry in entries if entry[1] is not None}
+        )
+        append_formatted = formatted.append
+        append_source = sources.append
 
-            formatted.append(f"{header}\n{doc}")
+        for doc, (course_title, lesson_num) in zip(results.documents, entries):
+            if lesson_num is None:
+                label, link = course_title, None
+            else:
+                label = f"{course_title} - Lesson {lesson_num}"
+                link = links.get((course_title, lesson_num))
 
-        # Store rich source objects for retrieval
-        self.last_sources = sources
+            # Rich source object with label and link for the UI
+            append_source({"label": label, "link": link})
+            append_formatted(f"[{label}]\n{doc}")
 
-        return "\n\n".join(formatted)
+        return "\n\n".join(formatted), sources
 
 
 class CourseOutlineTool(Tool):
     """Tool for retrieving course outlines with lesson information"""
 
-    def __init__(self, vector_store: VectorStore):
+    def __init__(self, vector_store: VectorStore, cache_ttl: float = 0.0):
         self.store = vector_store
         self.last_sources = []
+        # Formatted outlines keyed by course title: (timestamp, output, sources)
+        self.cache_ttl = cache_ttl
+        self._outline_cache: Dict[str, Tuple[float, str, list]] = {}
+        if cache_ttl > 0:
+            self.store.on_course_updated(self.invalidate)
+
+    def invalidate(self, course_title: Optional[str] = None):
+        """Drop the cached outline for a course, or all outlines if None"""
+        if course_title is None:
+            self._outline_cache.clear()
+        else:
+            self._outline_cache.pop(course_title, None)
 
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return OpenAI tool definition for this tool"""
@@ -167,6 +277,11 @@ class CourseOutlineTool(Tool):
         }
 
     def execute(self, course_name: str) -> str:
+        """Retrieve a course outline, keeping its source in last_sources"""
+        result, self.last_sources, _ = self.execute_with_sources(course_name)
+        return result
+
+    def execute_with_sources(self, course_name: str) -> Tuple[str, list, bool]:
         """
         Retrieve course outline with all lessons.
 
@@ -174,25 +289,33 @@ class CourseOutlineTool(Tool):
             course_name: The course name to search for
 
         Returns:
-            Formatted course outline with lessons
+            Tuple of (formatted course outline with lessons, sources,
+            whether retrieving it failed)
         """
-        import json
-
-        logger.info(f"CourseOutlineTool executing: course_name='{course_name}'")
+        logger.info("CourseOutlineTool executing: course_name='%s'", course_name)
 
         # Resolve course name using semantic search
         course_title = self.store._resolve_course_name(course_name)
         if not course_title:
-            logger.warning(f"No course found matching '{course_name}'")
-            return f"No course found matching '{course_name}'"
+            logger.warning("No course found matching '%s'", course_name)
+            return f"No course found matching '{course_name}'", [], False
 
-        logger.info(f"Resolved course: '{course_title}'")
+        logger.info("Resolved course: '%s'", course_title)
+
+        cached = self._outline_cache.get(course_title)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            _, output, sources = cached
+            return output, list(sources), False
 
         # Get course metadata from catalog
         try:
             results = self.store.course_catalog.get(ids=[course_title])
             if not results or not results["metadatas"]:
-                return f"Course '{course_title}' found but no metadata available"
+                return (
+                    f"Course '{course_title}' found but no metadata available",
+                    [],
+                    False,
+                )
 
             metadata = results["metadatas"][0]
             course_link = metadata.get("course_link", "No link available")
@@ -209,15 +332,77 @@ class CourseOutlineTool(Tool):
                 lesson_title = lesson.get("lesson_title", "Untitled")
                 output += f"  Lesson {lesson_num}: {lesson_title}\n"
 
-            # Store source for UI
-            self.last_sources = [
+            # Source for the UI
+            sources = [
                 {"label": f"{course_title} - Course Outline", "link": course_link}
             ]
 
-            return output
+            if self.cache_ttl > 0:
+                self._outline_cache[course_title] = (
+                    time.monotonic(),
+                    output,
+                    sources,
+                )
+            return output, list(sources), False
 
         except Exception as e:
-            return f"Error retrieving course outline: {str(e)}"
+            return f"Error retrieving course outline: {str(e)}", [], True
+
+
+# JSON Schema primitive types mapped to the Python types orjson decodes them to
+_JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "object": dict,
+    "array": list,
+}
+
+
+def _compile_validator(schema: Dict[str, Any]) -> Callable[[Any], dict]:
+    """
+    Build an argument validator for a tool's JSON Schema parameters.
+
+    Only the subset used by tool definitions is supported: an object with
+    typed properties and a required list. All schema lookups happen here, once,
+    so validating a call is a few dict and isinstance checks. The validator
+    returns the arguments with explicit nulls for optional properties dropped,
+    since models often send those instead of leaving the property out.
+
+    Raises:
+        ValueError: (from the returned validator) if arguments don't match
+    """
+    properties = {
+        name: _JSON_TYPES.get(prop.get("type"), object)
+        for name, prop in schema.get("properties", {}).items()
+    }
+    required = tuple(schema.get("required", ()))
+
+    def validate(arguments: Any) -> dict:
+        if not isinstance(arguments, dict):
+            raise ValueError("arguments must be a JSON object")
+        # An optional property set to null is the same as leaving it out
+        arguments = {
+            name: value
+            for name, value in arguments.items()
+            if value is not None or name in required
+        }
+        for name in required:
+            if name not in arguments:
+                raise ValueError(f"missing required argument '{name}'")
+        for name, value in arguments.items():
+            expected = properties.get(name)
+            if expected is None:
+                raise ValueError(f"unexpected argument '{name}'")
+            # JSON booleans are not integers, even though bool subclasses int
+            if not isinstance(value, expected) or (
+                isinstance(value, bool) and expected is not bool
+            ):
+                raise ValueError(f"argument '{name}' has the wrong type")
+        return arguments
+
+    return validate
 
 
 class ToolManager:
@@ -225,6 +410,10 @@ class ToolManager:
 
     def __init__(self):
         self.tools = {}
+        self._definitions = {}  # Tool name -> definition captured at registration
+        # Tools that track sources for the UI, found once at registration
+        self._source_tools: Dict[str, Tool] = {}
+        self._validators: Dict[str, Callable[[Any], dict]] = {}
 
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -237,10 +426,30 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        self._definitions[tool_name] = tool_def
+        parameters = tool_def.get("function", tool_def).get("parameters", {})
+        self._validators[tool_name] = _compile_validator(parameters)
+        self._source_tools.pop(tool_name, None)
+        if hasattr(tool, "last_sources"):
+            self._source_tools[tool_name] = tool
 
     def get_tool_definitions(self) -> list:
         """Get all tool definitions for OpenAI function calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        # Definitions are static, so they were captured once at registration
+        return list(self._definitions.values())
+
+    def parse_and_validate(self, tool_name: str, raw_arguments: str) -> dict:
+        """
+        Decode a tool call's JSON arguments and check them against its schema.
+
+        Raises:
+            ValueError: If the JSON is malformed or doesn't match the schema
+        """
+        arguments = orjson.loads(raw_arguments)
+        validator = self._validators.get(tool_name)
+        if validator is not None:
+            arguments = validator(arguments)
+        return arguments
 
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
@@ -249,16 +458,29 @@ class ToolManager:
 
         return self.tools[tool_name].execute(**kwargs)
 
+    def execute_tool_with_sources(
+        self, tool_name: str, **kwargs
+    ) -> Tuple[str, list, bool]:
+        """
+        Execute a tool by name and return its result, the sources it used and
+        whether it failed.
+
+        Unlike execute_tool followed by get_last_sources, this reads no state
+        shared between calls, so concurrent requests keep their own sources.
+        """
+        if tool_name not in self.tools:
+            return f"Tool '{tool_name}' not found", [], True
+
+        return self.tools[tool_name].execute_with_sources(**kwargs)
+
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
-        # Check all tools for last_sources attribute
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources") and tool.last_sources:
+        for tool in self._source_tools.values():
+            if tool.last_sources:
                 return tool.last_sources
         return []
 
     def reset_sources(self):
         """Reset sources from all tools that track sources"""
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources"):
-                tool.last_sources = []
+        for tool in self._source_tools.values():
+            tool.last_sources = []
@@ -0,0 +1,74 @@
+"""
+Pre-built chat completion responses shared by the test modules.
+
+Everything here is built once at import. The code under test only reads these
+objects, so every mock client can hand out the same instances.
+"""
+
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+
+class StubAPIError(Exception):
+    """Raised by mock OpenAI clients in place of an SDK error."""
+
+
+def completion(message, finish_reason):
+    """Chat completion response wrapping a single choice."""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=message, finish_reason=finish_reason)]
+    )
+
+
+def text_message(content):
+    """Assistant message with a final text answer and no tool calls."""
+    return SimpleNamespace(content=content, tool_calls=None)
+
+
+def tool_call(call_id, arguments, name="search_course_content"):
+    """A single function tool call as returned by the SDK."""
+    return ChatCompletionMessageToolCall(
+        id=call_id,
+        type="function",
+        function=Function(name=name, arguments=arguments),
+    )
+
+
+def tool_call_message(*tool_calls):
+    """Assistant message requesting the given tool calls."""
+    # A real SDK message, since the generator echoes it back via model_dump()
+    return ChatCompletionMessage(
+        role="assistant", content=None, tool_calls=list(tool_calls)
+    )
+
+
+def tool_call_response(*tool_calls):
+    """Completion whose only choice asks for the given tool calls."""
+    return completion(tool_call_message(*tool_calls), "tool_calls")
+
+
+def text_response(content):
+    """Completion whose only choice is a final text answer."""
+    return completion(text_message(content), "stop")
+
+
+TEXT_RESPONSE = text_response("Test response")
+
+# A tool call request followed by the final answer
+TOOL_CALL_RESPONSES = (
+    tool_call_response(tool_call("call_abc123", '{"query": "prompt caching"}')),
+    text_response("Prompt caching is a technique..."),
+)
+
+# Tool call with a course filter
+MCP_TOOL_CALL_RESPONSE = tool_call_response(
+    tool_call("call_456", '{"query": "test query", "course_name": "MCP"}')
+)
+
+# Two tool calls requested in the same round
+TWO_TOOL_CALLS_RESPONSE = tool_call_response(
+    tool_call("call_a", '{"query": "first"}'),
+    tool_call("call_b", '{"query": "second"}'),
+)
@@ -2,13 +2,39 @@
 Shared pytest fixtures for RAG chatbot tests.
 """
 
+import json
+import os
+from collections import deque
+from collections.abc import Mapping
 from dataclasses import dataclass
-from unittest.mock import Mock
+from types import MappingProxyType, SimpleNamespace
+from typing import Callable, List, Tuple
+from unittest.mock import AsyncMock, Mock, create_autospec
 
+import httpx
 import pytest
-
-
-@dataclass
+from openai import AsyncOpenAI
+from rag_system import RAGSystem
+
+# The models live outside app.py, so importing them doesn't build a real
+# RAGSystem (embedding model, ChromaDB) or mount the frontend
+from schemas import CourseStats, QueryRequest, QueryResponse, Source
+from search_tools import CourseSearchTool, ToolManager
+from tests._response_fixtures import TEXT_RESPONSE, TOOL_CALL_RESPONSES, StubAPIError
+from vector_store import SearchResults
+
+# Default search hits and answer sources. Tuples and read-only mappings, so a
+# test that mutates a shared default fails loudly instead of leaking state.
+_DOCS_OK = ("Content about prompt caching...",)
+_META_OK = (MappingProxyType({"course_title": "Test Course", "lesson_number": 1}),)
+_SOURCES_OK = (
+    MappingProxyType(
+        {"label": "Test Course - Lesson 1", "link": "https://example.com/lesson1"}
+    ),
+)
+
+
+@dataclass(frozen=True, slots=True)
 class MockConfig:
     """Test configuration matching the real Config structure."""
 
@@ -19,283 +45,390 @@ class MockConfig:
     CHUNK_OVERLAP: int = 100
     MAX_RESULTS: int = 5
     MAX_HISTORY: int = 2
+    SEMANTIC_CACHE_SIZE: int = 256
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_TTL: int = 600
+    OUTLINE_CACHE_TTL: int = 600
+    EMBEDDING_CACHE_TTL: int = 0
     CHROMA_PATH: str = "./test_chroma_db"
+    EMBEDDING_CACHE_PATH: str = "./test_embedding_cache.sqlite3"
 
 
-@pytest.fixture
-def mock_config():
-    """Standard test configuration with valid values."""
-    return MockConfig()
+@pytest.fixture(scope="session")
+def storage_paths(tmp_path_factory):
+    """
+    On-disk locations for anything a test might persist.
 
+    tmp_path_factory is private to each pytest-xdist worker, so parallel
+    workers never share a ChromaDB directory or cache file.
+    """
+    root = tmp_path_factory.mktemp("storage")
+    return {
+        "CHROMA_PATH": str(root / "chroma_db"),
+        "EMBEDDING_CACHE_PATH": str(root / "embedding_cache.sqlite3"),
+    }
 
-@pytest.fixture
-def mock_empty_config():
-    """Configuration with empty API key (simulates missing .env)."""
-    return MockConfig(OPENAI_API_KEY="")
 
+# MockConfig is frozen, so one instance of each can serve the whole session
 
-@pytest.fixture
-def mock_vector_store():
-    """Mock VectorStore with successful search results."""
-    store = Mock()
 
-    # Configure search to return valid results
-    mock_results = Mock()
-    mock_results.error = None
-    mock_results.documents = ["Content about prompt caching..."]
-    mock_results.metadata = [{"course_title": "Test Course", "lesson_number": 1}]
-    mock_results.is_empty.return_value = False
+@pytest.fixture(scope="session")
+def mock_config(storage_paths):
+    """Standard test configuration with valid values."""
+    return MockConfig(**storage_paths)
 
-    store.search.return_value = mock_results
-    store.get_lesson_link.return_value = "https://example.com/lesson1"
-    store._resolve_course_name.return_value = "Test Course"
 
-    return store
+@pytest.fixture(scope="session")
+def mock_empty_config(storage_paths):
+    """Configuration with empty API key (simulates missing .env)."""
+    return MockConfig(OPENAI_API_KEY="", **storage_paths)
+
+
+class StubVectorStore:
+    """
+    Hand-rolled VectorStore double returning canned search results.
+
+    Methods are plain functions that record their arguments in lists rather
+    than going through Mock's call machinery. Only the API the search tools
+    use is provided, so calling anything else raises AttributeError. That
+    includes embed(): tests exercising the semantic cache assign their own.
+    """
+
+    def __init__(self, results):
+        self.results = results
+        # Stands in for the Chroma collection; tests set get()'s return value
+        self.course_catalog = Mock()
+        self.search_calls = []
+        self.link_calls = []
+        self.course_update_callbacks = []
+
+    def search(
+        self,
+        query,
+        course_name=None,
+        lesson_number=None,
+        limit=None,
+        query_embedding=None,
+    ):
+        # Tests assert on the query and its filters, so only those are recorded
+        self.search_calls.append(
+            {"query": query, "course_name": course_name, "lesson_number": lesson_number}
+        )
+        return self.results
+
+    def get_lesson_links_batch(self, pairs):
+        self.link_calls.append(pairs)
+        return {pair: "https://example.com/lesson1" for pair in pairs}
+
+    def on_course_updated(self, callback):
+        self.course_update_callbacks.append(callback)
+
+    def _resolve_course_name(self, course_name):
+        return "Test Course"
+
+
+@pytest.fixture(scope="session")
+def mock_vector_store_factory():
+    """
+    Session-wide builder for stub VectorStores.
+
+    The builder is created once; each call returns a fresh store, so tests
+    that assert on calls or replace methods never see another test's state.
+    """
+
+    def make_vector_store(documents=None, metadata=None, error=None):
+        if documents is None:
+            documents = _DOCS_OK
+        if metadata is None:
+            metadata = _META_OK
+
+        results = SearchResults(
+            documents=documents, metadata=metadata, distances=[], error=error
+        )
+        return StubVectorStore(results)
+
+    return make_vector_store
+
+
+# Search outcomes a stub VectorStore can simulate, selected by fixture param
+_VECTOR_STORE_MODES = {
+    "ok": {},
+    "empty": {"documents": [], "metadata": []},
+    "error": {
+        "documents": [],
+        "metadata": [],
+        "error": "Search error: Connection failed",
+    },
+}
 
 
 @pytest.fixture
-def mock_vector_store_empty():
-    """Mock VectorStore that returns empty results."""
-    store = Mock()
+def mock_vector_store(request, mock_vector_store_factory):
+    """
+    Mock VectorStore with successful search results.
 
-    mock_results = Mock()
-    mock_results.error = None
-    mock_results.documents = []
-    mock_results.metadata = []
-    mock_results.is_empty.return_value = True
-
-    store.search.return_value = mock_results
-
-    return store
+    Select another outcome with indirect parametrization, e.g.
+    @pytest.mark.parametrize("mock_vector_store", ["empty"], indirect=True)
+    """
+    mode = getattr(request, "param", "ok")
+    return mock_vector_store_factory(**_VECTOR_STORE_MODES[mode])
 
 
 @pytest.fixture
-def mock_vector_store_error():
-    """Mock VectorStore that returns an error."""
-    store = Mock()
+def tool_manager(mock_vector_store):
+    """ToolManager with a CourseSearchTool over the mock vector store."""
+    manager = ToolManager()
+    manager.register_tool(CourseSearchTool(mock_vector_store))
+    return manager
+
+
+@pytest.fixture(scope="module")
+def _patched_rag_module(mock_config):
+    import rag_system
+
+    # Swap the collaborators in directly for construction only; the system
+    # keeps the instances it was given, and other tests in the module see the
+    # real classes
+    names = ("VectorStore", "AIGenerator", "DocumentProcessor")
+    saved = {name: getattr(rag_system, name) for name in names}
+    # spec_set keeps the mocks to the real classes' methods, so a renamed or
+    # misspelled attribute fails instead of quietly growing a child mock
+    mocks = {name: create_autospec(cls, spec_set=True) for name, cls in saved.items()}
+    try:
+        for name, mock in mocks.items():
+            setattr(rag_system, name, mock)
+        system = RAGSystem(mock_config)
+    finally:
+        for name, original in saved.items():
+            setattr(rag_system, name, original)
+
+    # One session with prior history, shared by tests that only need some
+    history_session = system.session_manager.create_session()
+    system.session_manager.add_exchange(
+        history_session, "previous question", "previous answer"
+    )
 
-    mock_results = Mock()
-    mock_results.error = "Search error: Connection failed"
-    mock_results.documents = []
-    mock_results.metadata = []
+    return SimpleNamespace(
+        system=system,
+        history_session=history_session,
+        **mocks,
+        vector_store=mocks["VectorStore"].return_value,
+        ai_generator=mocks["AIGenerator"].return_value,
+        document_processor=mocks["DocumentProcessor"].return_value,
+    )
 
-    store.search.return_value = mock_results
 
-    return store
+@pytest.fixture
+def patched_rag(_patched_rag_module):
+    """
+    RAGSystem built once per module over patched collaborators.
+
+    ``system`` is the RAGSystem; ``vector_store``, ``ai_generator`` and
+    ``document_processor`` are the mock instances it was given, and the
+    capitalised attributes are the patched classes, which keep their
+    construction calls. ``history_session`` is a session that already holds
+    one exchange. generate_response_with_sources answers "Answer" with no
+    sources unless a test reconfigures it; instances are reset after every
+    test.
+    """
+    _patched_rag_module.ai_generator.generate_response_with_sources = AsyncMock(
+        return_value=("Answer", [])
+    )
+    yield _patched_rag_module
+    for instance in (
+        _patched_rag_module.vector_store,
+        _patched_rag_module.ai_generator,
+        _patched_rag_module.document_processor,
+    ):
+        instance.reset_mock(return_value=True, side_effect=True)
+
+
+def _make_openai_client(*responses, error=None):
+    """Mock OpenAI client returning responses in order (or raising error)."""
+    if error is not None:
+        create = AsyncMock(side_effect=error)
+    elif len(responses) == 1:
+        create = AsyncMock(return_value=responses[0])
+    else:
+        create = AsyncMock(side_effect=list(responses))
+    # Only the client needs call tracking; everything it returns is plain data
+    return Mock(**{"chat.completions.create": create})
+
+
+@pytest.fixture(scope="session")
+def openai_client_factory():
+    """
+    Builder for mock OpenAI clients.
+
+    Each client gets its own AsyncMock, so call counts and side effects stay
+    per-test while the response objects are shared.
+    """
+    return _make_openai_client
 
 
 @pytest.fixture
 def mock_openai_client():
     """Mock OpenAI client with successful responses (no tool calls)."""
-    client = Mock()
+    return _make_openai_client(TEXT_RESPONSE)
 
-    # Successful completion response
-    mock_message = Mock()
-    mock_message.content = "Test response"
-    mock_message.tool_calls = None
 
-    mock_choice = Mock()
-    mock_choice.message = mock_message
-    mock_choice.finish_reason = "stop"
-
-    mock_response = Mock()
-    mock_response.choices = [mock_choice]
+@pytest.fixture
+def mock_openai_client_with_tool_call():
+    """Mock OpenAI client that returns a tool call then final response."""
+    return _make_openai_client(*TOOL_CALL_RESPONSES)
 
-    client.chat.completions.create.return_value = mock_response
 
-    return client
+@pytest.fixture
+def mock_openai_client_error():
+    """Mock OpenAI client that raises an error."""
+    return _make_openai_client(error=StubAPIError("API Error: Invalid request"))
 
 
 @pytest.fixture
-def mock_openai_client_with_tool_call():
-    """Mock OpenAI client that returns a tool call then final response."""
-    client = Mock()
+def patched_openai(monkeypatch):
+    """Replace ai_generator.AsyncOpenAI for one test and return the mock class.
 
-    # First call: returns tool call request
-    mock_tool_call = Mock()
-    mock_tool_call.id = "call_abc123"
-    mock_tool_call.type = "function"
-    mock_tool_call.function.name = "search_course_content"
-    mock_tool_call.function.arguments = '{"query": "prompt caching"}'
+    Set ``return_value`` to one of the client fixtures above to choose the
+    responses the generator sees.
+    """
+    import ai_generator
 
-    mock_message_with_tool = Mock()
-    mock_message_with_tool.content = None
-    mock_message_with_tool.tool_calls = [mock_tool_call]
+    mock_openai = Mock()
+    monkeypatch.setattr(ai_generator, "AsyncOpenAI", mock_openai)
+    return mock_openai
 
-    mock_choice_tool = Mock()
-    mock_choice_tool.message = mock_message_with_tool
-    mock_choice_tool.finish_reason = "tool_calls"
 
-    mock_response_tool = Mock()
-    mock_response_tool.choices = [mock_choice_tool]
+_FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
 
-    # Second call: returns final response after tool execution
-    mock_message_final = Mock()
-    mock_message_final.content = "Prompt caching is a technique..."
-    mock_message_final.tool_calls = None
 
-    mock_choice_final = Mock()
-    mock_choice_final.message = mock_message_final
-    mock_choice_final.finish_reason = "stop"
+class ChatCompletionsStub:
+    """
+    In-process HTTP stand-in for the chat completions endpoint.
 
-    mock_response_final = Mock()
-    mock_response_final.choices = [mock_choice_final]
+    A real AsyncOpenAI client talks to it through httpx.MockTransport, so
+    responses go through the SDK's own parsing. Queue fixture names with
+    respond_with(); each request body is recorded in ``requests``.
+    """
 
-    # Return different responses on consecutive calls
-    client.chat.completions.create.side_effect = [
-        mock_response_tool,
-        mock_response_final,
-    ]
+    def __init__(self, payloads):
+        self._payloads = payloads
+        self._queue = deque()
+        self.requests = []
+        self.client = AsyncOpenAI(
+            api_key="test-key",
+            base_url="https://api.test/v1",
+            max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self._handle)),
+        )
 
-    return client
+    def respond_with(self, *names):
+        self._queue.extend(names)
 
+    def reset(self):
+        self._queue.clear()
+        self.requests.clear()
 
-@pytest.fixture
-def mock_openai_client_error():
-    """Mock OpenAI client that raises an error."""
-    client = Mock()
-    client.chat.completions.create.side_effect = Exception("API Error: Invalid request")
-    return client
+    def _handle(self, request):
+        self.requests.append(json.loads(request.content))
+        return httpx.Response(200, json=self._payloads[self._queue.popleft()])
+
+
+@pytest.fixture(scope="session")
+def chat_completions_stub():
+    """One stub and client per session, serving the JSON files in fixtures/."""
+    payloads = {}
+    for filename in os.listdir(_FIXTURES_DIR):
+        name, ext = os.path.splitext(filename)
+        if ext == ".json":
+            with open(os.path.join(_FIXTURES_DIR, filename)) as f:
+                payloads[name] = json.load(f)
+    return ChatCompletionsStub(payloads)
 
 
 @pytest.fixture
-def mock_openai_client_two_tool_rounds():
-    """Mock OpenAI client simulating 2 sequential tool calling rounds."""
-    client = Mock()
-
-    # Round 1: First tool call
-    mock_tool_call_1 = Mock()
-    mock_tool_call_1.id = "call_round1"
-    mock_tool_call_1.type = "function"
-    mock_tool_call_1.function.name = "search_course_content"
-    mock_tool_call_1.function.arguments = '{"query": "prompt caching"}'
-
-    mock_msg1 = Mock()
-    mock_msg1.content = None
-    mock_msg1.tool_calls = [mock_tool_call_1]
-    mock_resp1 = Mock()
-    mock_resp1.choices = [Mock(message=mock_msg1, finish_reason="tool_calls")]
-
-    # Round 2: Second tool call after seeing round 1 results
-    mock_tool_call_2 = Mock()
-    mock_tool_call_2.id = "call_round2"
-    mock_tool_call_2.type = "function"
-    mock_tool_call_2.function.name = "search_course_content"
-    mock_tool_call_2.function.arguments = (
-        '{"query": "lesson 3 prompt caching", "lesson_number": 3}'
-    )
+def stub_openai(patched_openai, chat_completions_stub):
+    """Make AIGenerator use the stubbed client, starting from an empty queue."""
+    chat_completions_stub.reset()
+    patched_openai.return_value = chat_completions_stub.client
+    return chat_completions_stub
 
-    mock_msg2 = Mock()
-    mock_msg2.content = None
-    mock_msg2.tool_calls = [mock_tool_call_2]
-    mock_resp2 = Mock()
-    mock_resp2.choices = [Mock(message=mock_msg2, finish_reason="tool_calls")]
 
-    # Final response after 2 rounds
-    mock_msg3 = Mock()
-    mock_msg3.content = "Based on both searches, prompt caching allows..."
-    mock_msg3.tool_calls = None
-    mock_resp3 = Mock()
-    mock_resp3.choices = [Mock(message=mock_msg3, finish_reason="stop")]
+# API Testing Fixtures
 
-    client.chat.completions.create.side_effect = [mock_resp1, mock_resp2, mock_resp3]
-    return client
+def _default_query_response():
+    return ("Test answer about prompt caching", list(_SOURCES_OK))
 
 
-@pytest.fixture
-def mock_openai_client_max_rounds_reached():
-    """Mock OpenAI client that hits MAX_TOOL_ROUNDS limit."""
-    client = Mock()
-
-    # Round 1: Tool call
-    mock_tool_call_1 = Mock()
-    mock_tool_call_1.id = "call_round1"
-    mock_tool_call_1.type = "function"
-    mock_tool_call_1.function.name = "search_course_content"
-    mock_tool_call_1.function.arguments = '{"query": "search 1"}'
-
-    mock_msg1 = Mock()
-    mock_msg1.content = None
-    mock_msg1.tool_calls = [mock_tool_call_1]
-    mock_resp1 = Mock()
-    mock_resp1.choices = [Mock(message=mock_msg1, finish_reason="tool_calls")]
-
-    # Round 2: Another tool call
-    mock_tool_call_2 = Mock()
-    mock_tool_call_2.id = "call_round2"
-    mock_tool_call_2.type = "function"
-    mock_tool_call_2.function.name = "search_course_content"
-    mock_tool_call_2.function.arguments = '{"query": "search 2"}'
-
-    mock_msg2 = Mock()
-    mock_msg2.content = None
-    mock_msg2.tool_calls = [mock_tool_call_2]
-    mock_resp2 = Mock()
-    mock_resp2.choices = [Mock(message=mock_msg2, finish_reason="tool_calls")]
-
-    # Final call made without tools (max rounds reached)
-    mock_msg3 = Mock()
-    mock_msg3.content = "Synthesized answer from all tool results"
-    mock_msg3.tool_calls = None
-    mock_resp3 = Mock()
-    mock_resp3.choices = [Mock(message=mock_msg3, finish_reason="stop")]
-
-    client.chat.completions.create.side_effect = [mock_resp1, mock_resp2, mock_resp3]
-    return client
+def _default_course_analytics():
+    return {"total_courses": 2, "course_titles": ["Course 1", "Course 2"]}
 
 
-# API Testing Fixtures
+# Session-scoped mocks paired with the function that sets their defaults
+_SESSION_MOCKS: List[Tuple[Mock, Callable[[Mock], None]]] = []
 
-@pytest.fixture
-def mock_rag_system_for_api():
-    """Mock RAG system specifically for API tests."""
-    rag = Mock()
 
-    # Mock query method to return answer and sources
-    rag.query.return_value = (
-        "Test answer about prompt caching",
-        [{"label": "Test Course - Lesson 1", "link": "https://example.com/lesson1"}]
-    )
+def _register_session_mock(mock: Mock, configure: Callable[[Mock], None]) -> Mock:
+    """Configure a session-wide mock and have it reset after every test."""
+    configure(mock)
+    _SESSION_MOCKS.append((mock, configure))
+    return mock
 
-    # Mock get_course_analytics method
-    rag.get_course_analytics.return_value = {
-        "total_courses": 2,
-        "course_titles": ["Course 1", "Course 2"]
-    }
 
-    # Mock session manager
-    rag.session_manager = Mock()
+@pytest.fixture(autouse=True)
+def _reset_session_mocks():
+    """Clear call history, side effects and customized return values."""
+    yield
+    for mock, configure in _SESSION_MOCKS:
+        mock.reset_mock(return_value=True, side_effect=True)
+        configure(mock)
+
+
+def _configure_rag(rag):
+    rag.query.return_value = _default_query_response()
+    rag.get_course_analytics.return_value = _default_course_analytics()
     rag.session_manager.create_session.return_value = "session_123"
 
-    return rag
 
+@pytest.fixture(scope="session")
+def mock_rag_system_for_api():
+    """
+    Mock RAG system specifically for API tests.
 
-@pytest.fixture
+    Built once per session and reset after each test, so tests may customize
+    it freely.
+    """
+    rag = Mock()
+    # Mock query coroutine to return answer and sources
+    rag.query = AsyncMock()
+    return _register_session_mock(rag, _configure_rag)
+
+
+@pytest.fixture(scope="session")
 def test_app(mock_rag_system_for_api):
-    """Create a test FastAPI app without static files mounting."""
-    from fastapi import FastAPI, HTTPException
+    """
+    Create a test FastAPI app without static files mounting.
 
-    # Import Pydantic models from app.py
-    import sys
-    import os
-    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-    from app import QueryRequest, QueryResponse, CourseStats, Source
+    Built once per session; routes read the session-wide mock RAG system from
+    app.state.
+    """
+    from fastapi import FastAPI, HTTPException
 
     app = FastAPI()
-    test_rag = mock_rag_system_for_api
+    app.state.rag = mock_rag_system_for_api
 
     @app.post("/api/query", response_model=QueryResponse)
     async def query_documents(request: QueryRequest):
         """Test endpoint for query processing."""
+        test_rag = app.state.rag
         try:
             session_id = request.session_id
             if not session_id:
                 session_id = test_rag.session_manager.create_session()
 
-            answer, sources = test_rag.query(request.query, session_id)
+            answer, sources = await test_rag.query(request.query, session_id)
 
-            # Convert sources to Source objects if they're dicts
-            if sources and isinstance(sources[0], dict):
+            # Convert sources to Source objects if they're mappings
+            if sources and isinstance(sources[0], Mapping):
                 sources = [Source(**source) for source in sources]
 
             return QueryResponse(
@@ -310,7 +443,7 @@ def test_app(mock_rag_system_for_api):
     async def get_course_stats():
         """Test endpoint for course statistics."""
         try:
-            analytics = test_rag.get_course_analytics()
+            analytics = app.state.rag.get_course_analytics()
             return CourseStats(
                 total_courses=analytics["total_courses"],
                 course_titles=analytics["course_titles"]
@@ -321,8 +454,9 @@ def test_app(mock_rag_system_for_api):
     return app
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_client(test_app):
-    """Create FastAPI test client from test app."""
+    """Create one FastAPI test client from the test app for the whole session."""
     from fastapi.testclient import TestClient
-    return TestClient(test_app)
+    with TestClient(test_app) as client:
+        yield client
@@ -3,405 +3,841 @@ Unit tests for AIGenerator class.
 Tests tool calling flow and error handling.
 """
 
-import os
-import sys
-from unittest.mock import Mock, patch
-
+import asyncio
+import json
+import threading
+from dataclasses import replace
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+import httpx
 import pytest
-
-# Add backend to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ai_generator import (
+    PROMPT_CACHE_MIN_TOKENS,
+    AIGenerator,
+    _shared_http_client,
+    close_shared_http_client,
+)
+from config import config
+from search_tools import CourseSearchTool
+from tests._response_fixtures import (
+    MCP_TOOL_CALL_RESPONSE,
+    TWO_TOOL_CALLS_RESPONSE,
+    StubAPIError,
+    text_response,
+    tool_call,
+    tool_call_response,
+)
+
+# Tool definitions don't depend on the store, so build them once
+TOOL_DEFS = [CourseSearchTool(Mock()).get_tool_definition()]
 
 
 class TestAIGeneratorInitialization:
     """Tests for AIGenerator initialization."""
 
-    def test_initialization_with_valid_key(self):
+    def test_initialization_with_valid_key(self, patched_openai):
         """Verify AIGenerator initializes with valid API key."""
-        with patch("ai_generator.OpenAI") as mock_openai:
-            from ai_generator import AIGenerator
+        ai_gen = AIGenerator("test-api-key", "gpt-4o-mini")
+
+        async def clients():
+            return ai_gen.client, ai_gen.client, _shared_http_client()
+
+        first, again, http_client = asyncio.run(clients())
+
+        # The client is built on first use, once per event loop
+        assert first is again is patched_openai.return_value
+        patched_openai.assert_called_once_with(
+            api_key="test-api-key", http_client=http_client
+        )
+        assert ai_gen.model == "gpt-4o-mini"
+
+    def test_instances_share_http_client(self, patched_openai):
+        """All generators on one event loop reuse one pooled HTTP client."""
+
+        async def build_clients():
+            AIGenerator("key-1", "gpt-4o-mini").client
+            AIGenerator("key-2", "gpt-4o-mini").client
 
-            ai_gen = AIGenerator("test-api-key", "gpt-4o-mini")
+        asyncio.run(build_clients())
 
-            mock_openai.assert_called_once_with(api_key="test-api-key")
-            assert ai_gen.model == "gpt-4o-mini"
+        first, second = patched_openai.call_args_list
+        assert first.kwargs["http_client"] is second.kwargs["http_client"]
 
-    def test_initialization_with_empty_key_still_creates_client(self):
+    def test_each_event_loop_gets_its_own_http_client(self):
+        """A later asyncio.run() never reuses connections from a closed loop."""
+
+        async def use_and_close():
+            client = _shared_http_client()
+            await close_shared_http_client()
+            return client
+
+        first = asyncio.run(use_and_close())
+        second = asyncio.run(use_and_close())
+
+        assert first is not second
+        assert first.is_closed and second.is_closed
+
+    def test_initialization_with_empty_key_raises(self, patched_openai):
         """
-        Empty API key creates client (OpenAI SDK behavior).
-        Failure happens on first API call, not initialization.
+        Missing API key is rejected when the generator is built.
+        No OpenAI client is created for an empty or blank key.
         """
-        with patch("ai_generator.OpenAI") as mock_openai:
-            from ai_generator import AIGenerator
+        for key in ("", "   "):
+            with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+                AIGenerator(key, "gpt-4o-mini")
+
+        patched_openai.assert_not_called()
+
+    def test_warm_up_opens_connection_to_api(self, patched_openai, monkeypatch):
+        """Pre-warming sends an authenticated HEAD through the shared client."""
+        mock_http = Mock(head=AsyncMock())
+        monkeypatch.setattr("ai_generator._shared_http_client", lambda: mock_http)
+        patched_openai.return_value.base_url = httpx.URL("https://api.test/v1/")
+        patched_openai.return_value.api_key = "test-key"
+
+        asyncio.run(AIGenerator("test-key", "gpt-4o-mini").warm_up())
 
-            ai_gen = AIGenerator("", "gpt-4o-mini")
+        (url,), kwargs = mock_http.head.call_args
+        assert str(url) == "https://api.test/v1/models"
+        assert kwargs["headers"] == {"Authorization": "Bearer test-key"}
 
-            # OpenAI client is created even with empty key
-            mock_openai.assert_called_once_with(api_key="")
+    def test_warm_up_failure_is_not_raised(self, patched_openai, monkeypatch):
+        """Network errors while pre-warming are logged, not propagated."""
+        mock_http = Mock(head=AsyncMock(side_effect=httpx.ConnectError("offline")))
+        monkeypatch.setattr("ai_generator._shared_http_client", lambda: mock_http)
+        patched_openai.return_value.base_url = httpx.URL("https://api.test/v1/")
+
+        asyncio.run(AIGenerator("test-key", "gpt-4o-mini").warm_up())
+
+    def test_warns_when_prompt_below_cache_threshold(self, patched_openai, caplog):
+        """A system prompt too short for provider prompt caching is reported."""
+        with patch.object(
+            AIGenerator, "_SYSTEM_PROMPT_TOKENS", PROMPT_CACHE_MIN_TOKENS - 1
+        ):
+            AIGenerator("test-key", "gpt-4o-mini")
+        assert "prompt cache threshold" in caplog.text
+
+        caplog.clear()
+        with patch.object(
+            AIGenerator, "_SYSTEM_PROMPT_TOKENS", PROMPT_CACHE_MIN_TOKENS
+        ):
+            AIGenerator("test-key", "gpt-4o-mini")
+        assert "prompt cache threshold" not in caplog.text
 
 
 class TestGenerateResponse:
     """Tests for AIGenerator.generate_response() method."""
 
-    def test_simple_query_without_tools(self, mock_openai_client):
+    def test_simple_query_without_tools(self, patched_openai, mock_openai_client):
         """Test direct response without tool usage."""
-        with patch("ai_generator.OpenAI", return_value=mock_openai_client):
-            from ai_generator import AIGenerator
+        patched_openai.return_value = mock_openai_client
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            response = ai_gen.generate_response("What is Python?")
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        response = asyncio.run(ai_gen.generate_response("What is Python?"))
 
-            assert response == "Test response"
-            assert mock_openai_client.chat.completions.create.called
+        assert response == "Test response"
+        assert mock_openai_client.chat.completions.create.called
 
     def test_query_with_tool_call_flow(
-        self, mock_openai_client_with_tool_call, mock_vector_store
+        self, patched_openai, mock_openai_client_with_tool_call, tool_manager
     ):
         """Test complete two-stage tool call flow."""
-        with patch(
-            "ai_generator.OpenAI", return_value=mock_openai_client_with_tool_call
-        ):
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
+        patched_openai.return_value = mock_openai_client_with_tool_call
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-
-            tool_manager = ToolManager()
-            search_tool = CourseSearchTool(mock_vector_store)
-            tool_manager.register_tool(search_tool)
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
 
-            response = ai_gen.generate_response(
+        response = asyncio.run(
+            ai_gen.generate_response(
                 "What is prompt caching?",
-                tools=tool_manager.get_tool_definitions(),
+                tools=TOOL_DEFS,
                 tool_manager=tool_manager,
             )
+        )
 
-            assert response == "Prompt caching is a technique..."
-            # Should make 2 API calls: first for tool decision, second for final response
-            assert (
-                mock_openai_client_with_tool_call.chat.completions.create.call_count
-                == 2
-            )
+        assert response == "Prompt caching is a technique..."
+        # Should make 2 API calls: first for tool decision, second for final response
+        assert mock_openai_client_with_tool_call.chat.completions.create.call_count == 2
 
-    def test_api_error_propagates(self, mock_openai_client_error):
+    def test_api_error_propagates(self, patched_openai, mock_openai_client_error):
         """Test that OpenAI API errors propagate and are not swallowed."""
-        with patch("ai_generator.OpenAI", return_value=mock_openai_client_error):
-            from ai_generator import AIGenerator
-
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        patched_openai.return_value = mock_openai_client_error
 
-            with pytest.raises(Exception) as exc_info:
-                ai_gen.generate_response("Test query")
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
 
-            assert "API Error" in str(exc_info.value)
+        with pytest.raises(StubAPIError, match="API Error"):
+            asyncio.run(ai_gen.generate_response("Test query"))
 
-    def test_conversation_history_appended_to_system_prompt(self, mock_openai_client):
-        """Verify conversation history is included in system prompt."""
-        with patch("ai_generator.OpenAI", return_value=mock_openai_client):
-            from ai_generator import AIGenerator
+    def test_conversation_history_sent_after_system_prompt(
+        self, patched_openai, mock_openai_client
+    ):
+        """Conversation history follows the unchanged static system prompt."""
+        patched_openai.return_value = mock_openai_client
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            history = "User: Hello\nAssistant: Hi there!"
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        history = "User: Hello\nAssistant: Hi there!"
 
+        asyncio.run(
             ai_gen.generate_response("Follow up question", conversation_history=history)
+        )
 
-            call_args = mock_openai_client.chat.completions.create.call_args
-            messages = call_args.kwargs["messages"]
-            system_content = messages[0]["content"]
+        call_args = mock_openai_client.chat.completions.create.call_args
+        messages = call_args.kwargs["messages"]
 
-            assert history in system_content
+        assert messages[0]["content"] == AIGenerator.SYSTEM_PROMPT
+        assert messages[1]["role"] == "system"
+        assert history in messages[1]["content"]
+        assert messages[-1] == {"role": "user", "content": "Follow up question"}
 
 
-class TestToolExecution:
-    """Tests for tool execution handling in AIGenerator."""
+class TestResponseCache:
+    """Tests for the exact-match response cache."""
 
-    def test_malformed_json_arguments_handling(self, mock_vector_store):
-        """
-        CRITICAL TEST: Malformed JSON in tool arguments is handled gracefully.
+    def test_repeated_query_served_from_cache(self, patched_openai, mock_openai_client):
+        """Identical stateless query is answered without a second API call."""
+        patched_openai.return_value = mock_openai_client
 
-        New behavior (fixed): JSON parse error is logged and returns error message
-        as tool result, allowing the AI to handle the error gracefully.
-        """
-        with patch("ai_generator.OpenAI") as mock_openai:
-            # Setup response with malformed JSON in tool arguments
-            mock_tool_call = Mock()
-            mock_tool_call.id = "call_123"
-            mock_tool_call.type = "function"
-            mock_tool_call.function.name = "search_course_content"
-            mock_tool_call.function.arguments = "{ invalid json }"  # Malformed!
-
-            mock_msg1 = Mock()
-            mock_msg1.content = None
-            mock_msg1.tool_calls = [mock_tool_call]
-            mock_resp1 = Mock()
-            mock_resp1.choices = [Mock(message=mock_msg1, finish_reason="tool_calls")]
-
-            # Second call: AI should get error message and handle it
-            mock_msg2 = Mock()
-            mock_msg2.content = "I encountered an error processing that request."
-            mock_msg2.tool_calls = None
-            mock_resp2 = Mock()
-            mock_resp2.choices = [Mock(message=mock_msg2, finish_reason="stop")]
-
-            mock_client = Mock()
-            mock_client.chat.completions.create.side_effect = [mock_resp1, mock_resp2]
-            mock_openai.return_value = mock_client
-
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        first = asyncio.run(ai_gen.generate_response("What is Python?"))
+        second = asyncio.run(ai_gen.generate_response("What is Python?"))
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            tm = ToolManager()
-            tm.register_tool(CourseSearchTool(mock_vector_store))
+        assert first == second == "Test response"
+        assert mock_openai_client.chat.completions.create.call_count == 1
 
-            # Should now handle gracefully and return response
-            response = ai_gen.generate_response(
-                "test", tools=tm.get_tool_definitions(), tool_manager=tm
-            )
+    def test_cache_bypassed_with_history_or_flag(
+        self, patched_openai, mock_openai_client
+    ):
+        """Conversation history and use_cache=False always hit the API."""
+        patched_openai.return_value = mock_openai_client
 
-            # Verify it returned a response (error was handled gracefully)
-            assert response == "I encountered an error processing that request."
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        asyncio.run(ai_gen.generate_response("q"))
+        asyncio.run(ai_gen.generate_response("q", conversation_history="User: hi"))
+        asyncio.run(ai_gen.generate_response("q", use_cache=False))
 
-    def test_tool_manager_called_with_correct_args(self, mock_vector_store):
-        """Verify tool manager receives correct arguments from parsed JSON."""
-        with patch("ai_generator.OpenAI") as mock_openai:
-            # Setup valid tool call
-            mock_tool_call = Mock()
-            mock_tool_call.id = "call_456"
-            mock_tool_call.type = "function"
-            mock_tool_call.function.name = "search_course_content"
-            mock_tool_call.function.arguments = (
-                '{"query": "test query", "course_name": "MCP"}'
-            )
+        assert mock_openai_client.chat.completions.create.call_count == 3
 
-            mock_msg1 = Mock()
-            mock_msg1.content = None
-            mock_msg1.tool_calls = [mock_tool_call]
-            mock_resp1 = Mock()
-            mock_resp1.choices = [Mock(message=mock_msg1, finish_reason="tool_calls")]
+    def test_expired_or_cleared_entries_miss(
+        self, patched_openai, mock_openai_client, monkeypatch
+    ):
+        """Entries older than the TTL, or dropped by a clear, hit the API again."""
+        patched_openai.return_value = mock_openai_client
+        now = [1000.0]
+        monkeypatch.setattr("ai_generator.time.monotonic", lambda: now[0])
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        asyncio.run(ai_gen.generate_response("q"))
+        now[0] += config.RESPONSE_CACHE_TTL
+        asyncio.run(ai_gen.generate_response("q"))
+        ai_gen.clear_response_cache()
+        asyncio.run(ai_gen.generate_response("q"))
+
+        assert mock_openai_client.chat.completions.create.call_count == 3
+
+    def test_cache_hit_restores_sources(
+        self,
+        patched_openai,
+        mock_openai_client_with_tool_call,
+        tool_manager,
+        mock_vector_store,
+    ):
+        """Sources captured on the first answer are returned on a cache hit."""
+        patched_openai.return_value = mock_openai_client_with_tool_call
 
-            mock_msg2 = Mock()
-            mock_msg2.content = "Final response"
-            mock_msg2.tool_calls = None
-            mock_resp2 = Mock()
-            mock_resp2.choices = [Mock(message=mock_msg2, finish_reason="stop")]
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
 
-            mock_client = Mock()
-            mock_client.chat.completions.create.side_effect = [mock_resp1, mock_resp2]
-            mock_openai.return_value = mock_client
+        _, sources = asyncio.run(
+            ai_gen.generate_response_with_sources(
+                "query", tools=TOOL_DEFS, tool_manager=tool_manager
+            )
+        )
+        response, cached_sources = asyncio.run(
+            ai_gen.generate_response_with_sources(
+                "query", tools=TOOL_DEFS, tool_manager=tool_manager
+            )
+        )
+
+        assert response == "Prompt caching is a technique..."
+        assert cached_sources == sources != []
+        assert len(mock_vector_store.search_calls) == 1
+
+    @pytest.mark.parametrize(
+        "mock_vector_store, first_call",
+        [
+            ("error", tool_call("call_1", '{"query": "caching"}')),
+            ("ok", tool_call("call_1", "{")),
+        ],
+        ids=["search_error", "malformed_arguments"],
+        indirect=["mock_vector_store"],
+    )
+    def test_answer_from_failed_tool_call_not_cached(
+        self,
+        patched_openai,
+        openai_client_factory,
+        tool_manager,
+        mock_vector_store,
+        first_call,
+    ):
+        """An answer built on a failed tool call is not replayed from the cache."""
+        mock_client = openai_client_factory(
+            *(tool_call_response(first_call), text_response("Sorry")) * 2
+        )
+        patched_openai.return_value = mock_client
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        for _ in range(2):
+            response = asyncio.run(
+                ai_gen.generate_response(
+                    "query", tools=TOOL_DEFS, tool_manager=tool_manager
+                )
+            )
 
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
+        assert response == "Sorry"
+        assert mock_client.chat.completions.create.call_count == 4
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            tm = ToolManager()
-            tm.register_tool(CourseSearchTool(mock_vector_store))
 
-            ai_gen.generate_response(
-                "test", tools=tm.get_tool_definitions(), tool_manager=tm
-            )
-
-            # Verify search was called with correct args
-            mock_vector_store.search.assert_called_with(
-                query="test query", course_name="MCP", lesson_number=None
-            )
+class TestGenerateBatch:
+    """Tests for answering several stateless queries together."""
 
-    def test_tools_available_in_all_rounds(
-        self, mock_openai_client_with_tool_call, mock_vector_store
+    def test_batch_dedupes_and_preserves_order(
+        self, patched_openai, mock_openai_client
     ):
-        """Verify tools are available in all rounds for sequential tool calling."""
-        with patch(
-            "ai_generator.OpenAI", return_value=mock_openai_client_with_tool_call
-        ):
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
+        """Each distinct query is sent once; answers follow the input order."""
+        patched_openai.return_value = mock_openai_client
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        responses = asyncio.run(ai_gen.generate_batch(["a", "b", "a"]))
+
+        assert responses == ["Test response"] * 3
+        calls = mock_openai_client.chat.completions.create.call_args_list
+        assert [c.kwargs["messages"][-1]["content"] for c in calls] == ["a", "b"]
+
+
+class TestBatchApi:
+    """Tests for the offline Batch API path."""
+
+    def test_batch_round_trip(self, patched_openai, mock_openai_client):
+        """Queries are uploaded as JSONL and results mapped back by custom_id."""
+        client = mock_openai_client
+        client.files.create = AsyncMock(return_value=Mock(id="file-in"))
+        client.batches.create = AsyncMock(return_value=Mock(id="batch-1"))
+        client.batches.retrieve = AsyncMock(
+            side_effect=[
+                Mock(status="in_progress"),
+                Mock(status="completed", output_file_id="file-out"),
+            ]
+        )
+
+        def result(i, text):
+            body = {"choices": [{"message": {"content": text}}]}
+            return json.dumps(
+                {"custom_id": f"q-{i}", "response": {"status_code": 200, "body": body}}
+            )
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        output = "\n".join([result(1, "second"), result(0, "first")])
+        client.files.content = AsyncMock(return_value=Mock(text=output))
 
-            tool_manager = ToolManager()
-            search_tool = CourseSearchTool(mock_vector_store)
-            tool_manager.register_tool(search_tool)
+        patched_openai.return_value = client
 
-            ai_gen.generate_response(
-                "query",
-                tools=tool_manager.get_tool_definitions(),
-                tool_manager=tool_manager,
-            )
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        responses = asyncio.run(
+            ai_gen.generate_response_batch(["a", "b", "c"], poll_interval=0)
+        )
 
-            # Get all API calls
-            calls = (
-                mock_openai_client_with_tool_call.chat.completions.create.call_args_list
-            )
+        assert responses == ["first", "second", None]
+        _, upload = client.files.create.call_args.kwargs["file"]
+        requests = [json.loads(line) for line in upload.splitlines()]
+        assert [r["body"]["messages"][-1]["content"] for r in requests] == [
+            "a",
+            "b",
+            "c",
+        ]
+        assert client.batches.create.call_args.kwargs["completion_window"] == "24h"
+        client.chat.completions.create.assert_not_called()
 
-            # First call should have tools (round 1)
-            first_call_kwargs = calls[0].kwargs
-            assert "tools" in first_call_kwargs
+    def test_failed_batch_raises(self, patched_openai, mock_openai_client):
+        """A batch that ends without completing surfaces as an error."""
+        client = mock_openai_client
+        client.batches.retrieve = AsyncMock(return_value=Mock(status="expired"))
 
-            # Second call should ALSO have tools (round 2, for sequential calling)
-            second_call_kwargs = calls[1].kwargs
-            assert "tools" in second_call_kwargs
+        patched_openai.return_value = client
 
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        with pytest.raises(RuntimeError, match="expired"):
+            asyncio.run(ai_gen.collect_batch("batch-1", 1, poll_interval=0))
 
-class TestAPIKeyValidation:
-    """Tests for API key validation behavior."""
 
-    def test_empty_api_key_causes_failure_on_api_call(self):
-        """Empty API key causes authentication failure on first API call."""
-        with patch("ai_generator.OpenAI") as mock_openai:
-            mock_client = Mock()
-            mock_client.chat.completions.create.side_effect = Exception(
-                "Incorrect API key provided"
-            )
-            mock_openai.return_value = mock_client
+class TestToolExecution:
+    """Tests for tool execution handling in AIGenerator."""
 
-            from ai_generator import AIGenerator
+    @pytest.mark.parametrize(
+        "bad_args",
+        [
+            "",
+            "{",
+            "{ invalid json }",
+            '{"query": "caching",}',
+            "null",
+            "[]",
+            '{"query": 123}',
+            '{"query": null}',
+        ],
+        ids=[
+            "empty",
+            "truncated",
+            "invalid",
+            "trailing_comma",
+            "null",
+            "array",
+            "wrong_type",
+            "required_null",
+        ],
+    )
+    def test_malformed_json_arguments_handling(
+        self,
+        patched_openai,
+        openai_client_factory,
+        tool_manager,
+        mock_vector_store,
+        bad_args,
+    ):
+        """
+        CRITICAL TEST: Malformed JSON in tool arguments is handled gracefully.
 
-            ai_gen = AIGenerator("", "gpt-4o-mini")  # Empty key
+        New behavior (fixed): JSON parse error is logged and returns error message
+        as tool result, allowing the AI to handle the error gracefully.
+        """
+        mock_client = openai_client_factory(
+            tool_call_response(tool_call("call_123", bad_args)),
+            text_response("I encountered an error processing that request."),
+        )
+        patched_openai.return_value = mock_client
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+
+        # Should now handle gracefully and return response
+        response = asyncio.run(
+            ai_gen.generate_response("test", tools=TOOL_DEFS, tool_manager=tool_manager)
+        )
+
+        # Verify it returned a response (error was handled gracefully)
+        assert response == "I encountered an error processing that request."
+        assert mock_vector_store.search_calls == []
+
+        # The parse error went back to the model as the tool result
+        messages = mock_client.chat.completions.create.call_args.kwargs["messages"]
+        assert messages[-1]["role"] == "tool"
+        assert messages[-1]["tool_call_id"] == "call_123"
+        assert messages[-1]["content"].startswith("Error: Failed to parse")
+
+    def test_tool_manager_called_with_correct_args(
+        self, patched_openai, openai_client_factory, tool_manager, mock_vector_store
+    ):
+        """Verify tool manager receives correct arguments from parsed JSON."""
+        mock_client = openai_client_factory(
+            MCP_TOOL_CALL_RESPONSE, text_response("Final response")
+        )
+        patched_openai.return_value = mock_client
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+
+        asyncio.run(
+            ai_gen.generate_response("test", tools=TOOL_DEFS, tool_manager=tool_manager)
+        )
+
+        # Verify search was called with correct args
+        assert mock_vector_store.search_calls[-1] == {
+            "query": "test query",
+            "course_name": "MCP",
+            "lesson_number": None,
+        }
+
+    def test_explicit_null_optional_arguments_accepted(
+        self, patched_openai, openai_client_factory, tool_manager, mock_vector_store
+    ):
+        """Optional arguments sent as JSON null are treated as omitted."""
+        patched_openai.return_value = openai_client_factory(
+            tool_call_response(
+                tool_call(
+                    "call_789",
+                    '{"query": "x", "course_name": null, "lesson_number": null}',
+                )
+            ),
+            text_response("Final response"),
+        )
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+
+        asyncio.run(
+            ai_gen.generate_response("test", tools=TOOL_DEFS, tool_manager=tool_manager)
+        )
+
+        assert mock_vector_store.search_calls == [
+            {"query": "x", "course_name": None, "lesson_number": None}
+        ]
+
+    def test_multiple_tool_calls_in_one_round(
+        self, patched_openai, openai_client_factory
+    ):
+        """All tool calls in a round execute and results keep request order."""
+        mock_client = openai_client_factory(
+            TWO_TOOL_CALLS_RESPONSE, text_response("Combined answer")
+        )
+        patched_openai.return_value = mock_client
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        tm = Mock()
+        tm.parse_and_validate.side_effect = lambda name, raw: json.loads(raw)
+        tm.execute_tool_with_sources.side_effect = lambda name, query: (
+            f"result for {query}",
+            [],
+            False,
+        )
+
+        response = asyncio.run(
+            ai_gen.generate_response("test", tools=[{}], tool_manager=tm)
+        )
+
+        assert response == "Combined answer"
+        assert tm.execute_tool_with_sources.call_count == 2
+
+        # Tool results follow the assistant message in request order
+        messages = mock_client.chat.completions.create.call_args.kwargs["messages"]
+        tool_messages = [m for m in messages if m["role"] == "tool"]
+        assert [m["tool_call_id"] for m in tool_messages] == ["call_a", "call_b"]
+        assert tool_messages[1]["content"] == "result for second"
 
-            with pytest.raises(Exception) as exc_info:
-                ai_gen.generate_response("test")
 
-            assert "API key" in str(exc_info.value)
+class TestAPIKeyValidation:
+    """Tests for API key validation behavior."""
 
-    def test_invalid_api_key_format_causes_failure(self):
-        """Invalid API key format causes authentication failure."""
-        with patch("ai_generator.OpenAI") as mock_openai:
-            mock_client = Mock()
-            mock_client.chat.completions.create.side_effect = Exception(
-                "Invalid API key format"
-            )
-            mock_openai.return_value = mock_client
+    def test_empty_api_key_fails_before_any_api_call(self, patched_openai):
+        """Empty API key is caught up front instead of on the first request."""
+        with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+            AIGenerator("", "gpt-4o-mini")  # Empty key
 
-            from ai_generator import AIGenerator
+        patched_openai.assert_not_called()
 
-            ai_gen = AIGenerator("not-a-valid-key", "gpt-4o-mini")
+    def test_invalid_api_key_format_causes_failure(
+        self, patched_openai, openai_client_factory
+    ):
+        """Invalid API key format causes authentication failure."""
+        patched_openai.return_value = openai_client_factory(
+            error=StubAPIError("Incorrect API key provided")
+        )
 
-            with pytest.raises(Exception) as exc_info:
-                ai_gen.generate_response("test")
+        ai_gen = AIGenerator("not-a-valid-key", "gpt-4o-mini")
 
-            assert "Invalid" in str(exc_info.value) or "API key" in str(exc_info.value)
+        with pytest.raises(StubAPIError, match="API key"):
+            asyncio.run(ai_gen.generate_response("test"))
 
 
+@pytest.mark.slow
 class TestSequentialToolCalling:
-    """Tests for multi-round sequential tool calling capability."""
+    """
+    Tests for multi-round sequential tool calling capability.
+
+    These go through the real SDK client against the HTTP stub, so responses
+    are parsed and request bodies serialized exactly as in production.
+    """
 
     def test_two_sequential_tool_rounds(
-        self, mock_openai_client_two_tool_rounds, mock_vector_store
+        self, stub_openai, tool_manager, mock_vector_store
     ):
         """Test that AI can make 2 sequential tool calls across separate API rounds."""
-        with patch(
-            "ai_generator.OpenAI", return_value=mock_openai_client_two_tool_rounds
-        ):
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
+        stub_openai.respond_with(
+            "tool_call_round", "tool_call_round_lesson", "final_answer"
+        )
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            tm = ToolManager()
-            tm.register_tool(CourseSearchTool(mock_vector_store))
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
 
-            response = ai_gen.generate_response(
+        response = asyncio.run(
+            ai_gen.generate_response(
                 "Tell me about prompt caching",
-                tools=tm.get_tool_definitions(),
-                tool_manager=tm,
+                tools=TOOL_DEFS,
+                tool_manager=tool_manager,
             )
+        )
 
-            # Verify final response
-            assert response == "Based on both searches, prompt caching allows..."
+        # Verify final response
+        assert response == "Based on both searches, prompt caching allows..."
 
-            # Verify 3 API calls were made (round 1, round 2, final synthesis)
-            assert (
-                mock_openai_client_two_tool_rounds.chat.completions.create.call_count
-                == 3
-            )
+        # Verify 3 API calls were made (round 1, round 2, final synthesis)
+        assert len(stub_openai.requests) == 3
 
-            # Verify both tool searches were executed
-            assert mock_vector_store.search.call_count == 2
+        # Verify both tool searches were executed, with the parsed arguments
+        assert len(mock_vector_store.search_calls) == 2
+        assert mock_vector_store.search_calls[-1] == {
+            "query": "lesson 3 prompt caching",
+            "course_name": None,
+            "lesson_number": 3,
+        }
 
-    def test_max_tool_rounds_enforced(
-        self, mock_openai_client_max_rounds_reached, mock_vector_store
-    ):
+    def test_max_tool_rounds_enforced(self, stub_openai, tool_manager):
         """Test that MAX_TOOL_ROUNDS limit is enforced."""
-        with patch(
-            "ai_generator.OpenAI", return_value=mock_openai_client_max_rounds_reached
-        ):
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
+        stub_openai.respond_with(
+            "tool_call_round", "tool_call_round_lesson", "final_answer"
+        )
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            tm = ToolManager()
-            tm.register_tool(CourseSearchTool(mock_vector_store))
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
 
-            response = ai_gen.generate_response(
+        asyncio.run(
+            ai_gen.generate_response(
                 "Complex query requiring multiple searches",
-                tools=tm.get_tool_definitions(),
-                tool_manager=tm,
+                tools=TOOL_DEFS,
+                tool_manager=tool_manager,
             )
+        )
 
-            # Verify final response after hitting limit
-            assert response == "Synthesized answer from all tool results"
+        # Both tool rounds offer tools; the forced synthesis call does not
+        first, second, final = stub_openai.requests
+        assert "tools" in first and "tools" in second
+        assert "tools" not in final
 
-            # Verify exactly 3 API calls (2 tool rounds + 1 final synthesis)
-            assert (
-                mock_openai_client_max_rounds_reached.chat.completions.create.call_count
-                == 3
-            )
-
-            # Verify both tool searches were executed
-            assert mock_vector_store.search.call_count == 2
+        # The final call sees both rounds of tool results
+        tool_ids = [m["tool_call_id"] for m in final["messages"] if m["role"] == "tool"]
+        assert tool_ids == ["call_round1", "call_round2"]
 
     def test_early_stop_when_no_more_tools_needed(
-        self, mock_openai_client_with_tool_call, mock_vector_store
+        self, stub_openai, tool_manager, mock_vector_store
     ):
         """Test that loop stops early if AI doesn't request more tools."""
-        with patch(
-            "ai_generator.OpenAI", return_value=mock_openai_client_with_tool_call
-        ):
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
+        stub_openai.respond_with("tool_call_round", "final_answer")
 
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            tm = ToolManager()
-            tm.register_tool(CourseSearchTool(mock_vector_store))
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
 
-            response = ai_gen.generate_response(
-                "Simple query", tools=tm.get_tool_definitions(), tool_manager=tm
+        response = asyncio.run(
+            ai_gen.generate_response(
+                "Simple query", tools=TOOL_DEFS, tool_manager=tool_manager
             )
+        )
 
-            # Verify response
-            assert response == "Prompt caching is a technique..."
+        # Verify response
+        assert response == "Based on both searches, prompt caching allows..."
 
-            # Should only make 2 API calls (tool round + stop response)
-            assert (
-                mock_openai_client_with_tool_call.chat.completions.create.call_count
-                == 2
-            )
+        # Should only make 2 API calls (tool round + stop response)
+        assert len(stub_openai.requests) == 2
 
-            # Only one search executed
-            assert mock_vector_store.search.call_count == 1
+        # Only one search executed
+        assert len(mock_vector_store.search_calls) == 1
 
-    def test_tools_available_in_second_round(self, mock_openai_client_two_tool_rounds):
-        """Verify tools are provided in the second API round."""
-        with patch(
-            "ai_generator.OpenAI", return_value=mock_openai_client_two_tool_rounds
-        ):
-            from unittest.mock import Mock
+    def test_assistant_tool_call_echoed_back(self, stub_openai, tool_manager):
+        """The assistant's tool call message is sent back in the API's shape."""
+        stub_openai.respond_with("tool_call_round", "final_answer")
 
-            from ai_generator import AIGenerator
-            from search_tools import CourseSearchTool, ToolManager
-
-            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
-            tm = ToolManager()
-            tm.register_tool(CourseSearchTool(Mock()))
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
 
+        asyncio.run(
             ai_gen.generate_response(
-                "query", tools=tm.get_tool_definitions(), tool_manager=tm
+                "query", tools=TOOL_DEFS, tool_manager=tool_manager
             )
-
-            # Get all API call kwargs
-            calls = (
-                mock_openai_client_two_tool_rounds.chat.completions.create.call_args_list
+        )
+
+        messages = stub_openai.requests[1]["messages"]
+        assistant = next(m for m in messages if m["role"] == "assistant")
+        assert assistant["tool_calls"] == [
+            {
+                "id": "call_round1",
+                "type": "function",
+                "function": {
+                    "name": "search_course_content",
+                    "arguments": '{"query": "prompt caching"}',
+                },
+            }
+        ]
+
+
+def _stream_chunk(content=None, tool_calls=None, finish_reason=None):
+    """Build one streamed chat completion chunk."""
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)]
+    )
+
+
+def _tool_delta(index, call_id=None, name=None, arguments=""):
+    """Build a streamed tool call fragment."""
+    function = SimpleNamespace(name=name, arguments=arguments)
+    return SimpleNamespace(index=index, id=call_id, function=function)
+
+
+async def _stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestStreamingToolCalls:
+    """Tests for the streamed tool-calling round."""
+
+    def test_streamed_tool_calls_are_assembled_and_executed(self, patched_openai):
+        """Fragmented tool calls are reassembled, executed and answered."""
+        first_round = _stream(
+            _stream_chunk(
+                tool_calls=[_tool_delta(0, "call_a", "search_course_content", '{"qu')]
+            ),
+            _stream_chunk(tool_calls=[_tool_delta(0, arguments='ery": "first"}')]),
+            _stream_chunk(
+                tool_calls=[
+                    _tool_delta(1, "call_b", "search_course_content", '{"query": ')
+                ]
+            ),
+            _stream_chunk(tool_calls=[_tool_delta(1, arguments='"second"}')]),
+            _stream_chunk(finish_reason="tool_calls"),
+        )
+        second_round = _stream(
+            _stream_chunk(content="Final "),
+            _stream_chunk(content="answer"),
+            _stream_chunk(finish_reason="stop"),
+        )
+        mock_client = Mock()
+        mock_client.chat.completions.create = AsyncMock(
+            side_effect=[first_round, second_round]
+        )
+        tm = Mock()
+        tm.parse_and_validate.side_effect = lambda name, raw: json.loads(raw)
+        tm.execute_tool_with_sources.side_effect = lambda name, query: (
+            f"result for {query}",
+            [],
+            False,
+        )
+
+        patched_openai.return_value = mock_client
+
+        with patch("ai_generator.config", replace(config, STREAM_TOOL_CALLS=True)):
+            ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+            response = asyncio.run(
+                ai_gen.generate_response("test", tools=[{}], tool_manager=tm)
             )
 
-            # Both round 1 and round 2 should have tools
-            assert "tools" in calls[0].kwargs  # Round 1
-            assert "tools" in calls[1].kwargs  # Round 2
+        assert response == "Final answer"
+        assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+        messages = mock_client.chat.completions.create.call_args.kwargs["messages"]
+        assistant = next(m for m in messages if m["role"] == "assistant")
+        assert [tc["function"]["arguments"] for tc in assistant["tool_calls"]] == [
+            '{"query": "first"}',
+            '{"query": "second"}',
+        ]
+        tool_messages = [m for m in messages if m["role"] == "tool"]
+        assert [m["content"] for m in tool_messages] == [
+            "result for first",
+            "result for second",
+        ]
+
+    def test_tool_dispatched_before_stream_ends(self, patched_openai, monkeypatch):
+        """A call runs as soon as the next one starts, not at the end of stream."""
+        executed = threading.Event()
+        executed_before_end = []
+
+        async def first_round():
+            yield _stream_chunk(
+                tool_calls=[
+                    _tool_delta(0, "call_a", "search_course_content", '{"query": "a"}')
+                ]
+            )
+            yield _stream_chunk(
+                tool_calls=[
+                    _tool_delta(1, "call_b", "search_course_content", '{"query": "b"}')
+                ]
+            )
+            # Call 0 is complete now, so it may run while the stream continues
+            executed_before_end.append(await asyncio.to_thread(executed.wait, 5))
+            yield _stream_chunk(finish_reason="tool_calls")
+
+        def execute(name, query):
+            if query == "a":
+                executed.set()
+            return f"result for {query}", [], False
+
+        patched_openai.return_value = Mock(
+            **{
+                "chat.completions.create": AsyncMock(
+                    side_effect=[
+                        first_round(),
+                        _stream(_stream_chunk("Done", None, "stop")),
+                    ]
+                )
+            }
+        )
+        tm = Mock()
+        tm.parse_and_validate.side_effect = lambda name, raw: json.loads(raw)
+        tm.execute_tool_with_sources.side_effect = execute
+        monkeypatch.setattr(
+            "ai_generator.config", replace(config, STREAM_TOOL_CALLS=True)
+        )
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        response = asyncio.run(
+            ai_gen.generate_response("test", tools=[{}], tool_manager=tm)
+        )
+
+        assert response == "Done"
+        assert executed_before_end == [True]
+        assert tm.execute_tool_with_sources.call_count == 2
+
+    def test_pending_calls_cancelled_when_model_answers(
+        self, patched_openai, monkeypatch
+    ):
+        """Calls dispatched early are cancelled if the round ends without tools."""
+        cancelled = []
+
+        async def stalled_tool_call(tool_call, tool_manager):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(tool_call.id)
+                raise
+
+        async def answer_round():
+            yield _stream_chunk(
+                tool_calls=[
+                    _tool_delta(0, "call_a", "search_course_content", '{"query": "a"}')
+                ]
+            )
+            yield _stream_chunk(
+                tool_calls=[
+                    _tool_delta(1, "call_b", "search_course_content", '{"query": "b"}')
+                ]
+            )
+            # Let the early-dispatched call start before the model changes course
+            await asyncio.sleep(0)
+            yield _stream_chunk(content="Direct answer", finish_reason="stop")
+
+        patched_openai.return_value = Mock(
+            **{"chat.completions.create": AsyncMock(return_value=answer_round())}
+        )
+        monkeypatch.setattr(
+            "ai_generator.config", replace(config, STREAM_TOOL_CALLS=True)
+        )
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        ai_gen._execute_tool_call = stalled_tool_call
+
+        async def run():
+            response = await ai_gen.generate_response(
+                "test", tools=[{}], tool_manager=Mock()
+            )
+            # One loop pass delivers the cancellation to the stalled call
+            await asyncio.sleep(0)
+            return response
+
+        assert asyncio.run(run()) == "Direct answer"
+        assert cancelled == ["call_a"]
+
+    def test_empty_filtered_answer_ends_loop(self, patched_openai, monkeypatch):
+        """A round that ends without tools and without content is still final."""
+        mock_create = AsyncMock(
+            return_value=_stream(_stream_chunk(finish_reason="content_filter"))
+        )
+        patched_openai.return_value = Mock(**{"chat.completions.create": mock_create})
+        monkeypatch.setattr(
+            "ai_generator.config", replace(config, STREAM_TOOL_CALLS=True)
+        )
+
+        ai_gen = AIGenerator("test-key", "gpt-4o-mini")
+        response = asyncio.run(
+            ai_gen.generate_response("test", tools=[{}], tool_manager=Mock())
+        )
+
+        assert response is None
+        assert mock_create.call_count == 1
@@ -3,119 +3,224 @@ Unit tests for CourseSearchTool.execute() method.
 Tests the search tool's ability to handle various scenarios.
 """
 
-import os
-import sys
-
+import numpy as np
 import pytest
-
-# Add backend to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-
-from search_tools import CourseSearchTool
+from search_tools import CourseOutlineTool, CourseSearchTool
 
 
 class TestCourseSearchToolExecute:
     """Tests for CourseSearchTool.execute() method."""
 
-    def test_execute_with_valid_query(self, mock_vector_store):
-        """Search returns results successfully with valid query."""
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute(query="prompt caching")
+    @pytest.fixture
+    def search_tool(self, mock_vector_store):
+        """A fresh tool over this test's stub store."""
+        return CourseSearchTool(mock_vector_store)
 
-        mock_vector_store.search.assert_called_once_with(
-            query="prompt caching", course_name=None, lesson_number=None
-        )
+    def test_execute_with_valid_query(self, search_tool, mock_vector_store):
+        """Search returns results successfully with valid query."""
+        result = search_tool.execute(query="prompt caching")
+
+        assert len(mock_vector_store.search_calls) == 1
+        assert mock_vector_store.search_calls[-1] == {
+            "query": "prompt caching",
+            "course_name": None,
+            "lesson_number": None,
+        }
         assert "[Test Course - Lesson 1]" in result
         assert "Content about prompt caching" in result
 
-    def test_execute_with_course_filter(self, mock_vector_store):
-        """Filter by course name works correctly."""
-        tool = CourseSearchTool(mock_vector_store)
-        tool.execute(query="test", course_name="MCP")
-
-        mock_vector_store.search.assert_called_with(
-            query="test", course_name="MCP", lesson_number=None
-        )
-
-    def test_execute_with_lesson_filter(self, mock_vector_store):
-        """Filter by lesson number works correctly."""
-        tool = CourseSearchTool(mock_vector_store)
-        tool.execute(query="test", lesson_number=3)
-
-        mock_vector_store.search.assert_called_with(
-            query="test", course_name=None, lesson_number=3
-        )
-
-    def test_execute_with_all_filters(self, mock_vector_store):
-        """Filter by both course name and lesson number works."""
-        tool = CourseSearchTool(mock_vector_store)
-        tool.execute(query="caching", course_name="MCP Course", lesson_number=5)
-
-        mock_vector_store.search.assert_called_with(
-            query="caching", course_name="MCP Course", lesson_number=5
-        )
-
-    def test_execute_with_empty_results(self, mock_vector_store_empty):
+    @pytest.mark.parametrize(
+        "kwargs, expected",
+        [
+            ({"course_name": "MCP"}, {"course_name": "MCP", "lesson_number": None}),
+            ({"lesson_number": 3}, {"course_name": None, "lesson_number": 3}),
+            (
+                {"course_name": "MCP Course", "lesson_number": 5},
+                {"course_name": "MCP Course", "lesson_number": 5},
+            ),
+        ],
+        ids=["course", "lesson", "course_and_lesson"],
+    )
+    def test_execute_passes_filters(
+        self, search_tool, mock_vector_store, kwargs, expected
+    ):
+        """Course and lesson filters are forwarded to the vector store."""
+        search_tool.execute(query="test", **kwargs)
+
+        assert len(mock_vector_store.search_calls) == 1
+        assert mock_vector_store.search_calls[-1] == {
+            "query": "test",
+            **expected,
+        }
+
+    @pytest.mark.parametrize("mock_vector_store", ["empty"], indirect=True)
+    def test_execute_with_empty_results(self, search_tool):
         """Returns proper message when no results found."""
-        tool = CourseSearchTool(mock_vector_store_empty)
-        result = tool.execute(query="nonexistent topic")
+        result = search_tool.execute(query="nonexistent topic")
 
         assert "No relevant content found" in result
 
-    def test_execute_with_search_error(self, mock_vector_store_error):
+    @pytest.mark.parametrize("mock_vector_store", ["error"], indirect=True)
+    def test_execute_with_search_error(self, search_tool):
         """Handles search errors gracefully by returning error message."""
-        tool = CourseSearchTool(mock_vector_store_error)
-        result = tool.execute(query="test")
+        result = search_tool.execute(query="test")
 
         assert "Search error:" in result
         assert "Connection failed" in result
 
-    def test_execute_missing_query_raises_error(self, mock_vector_store):
+    def test_execute_missing_query_raises_error(self, search_tool):
         """
         CRITICAL TEST: Missing query parameter raises TypeError.
         This simulates what happens when JSON parsing fails in ai_generator
         and the tool is called with empty kwargs {}.
         """
-        tool = CourseSearchTool(mock_vector_store)
-
-        with pytest.raises(TypeError) as exc_info:
-            tool.execute()  # No query - simulates JSON parse failure fallback
-
-        assert "query" in str(exc_info.value).lower()
+        with pytest.raises(TypeError, match="query"):
+            search_tool.execute()  # No query - simulates JSON parse failure fallback
 
-    def test_sources_tracked_after_search(self, mock_vector_store):
+    def test_sources_tracked_after_search(self, search_tool):
         """Sources are stored in last_sources for UI retrieval."""
-        tool = CourseSearchTool(mock_vector_store)
-        tool.last_sources = []  # Reset
-
-        tool.execute(query="test")
+        search_tool.execute(query="test")
 
-        assert len(tool.last_sources) == 1
-        assert tool.last_sources[0]["label"] == "Test Course - Lesson 1"
-        assert tool.last_sources[0]["link"] == "https://example.com/lesson1"
+        assert len(search_tool.last_sources) == 1
+        assert search_tool.last_sources[0]["label"] == "Test Course - Lesson 1"
+        assert search_tool.last_sources[0]["link"] == "https://example.com/lesson1"
 
-    def test_sources_include_link_from_vector_store(self, mock_vector_store):
+    def test_sources_include_link_from_vector_store(
+        self, search_tool, mock_vector_store
+    ):
         """Lesson links are retrieved from vector store."""
-        tool = CourseSearchTool(mock_vector_store)
-        tool.execute(query="test")
+        search_tool.execute(query="test")
 
-        # Verify get_lesson_link was called
-        mock_vector_store.get_lesson_link.assert_called_with("Test Course", 1)
+        # All lesson links are resolved in one batched lookup
+        assert mock_vector_store.link_calls == [{("Test Course", 1)}]
 
-    def test_format_results_header_format(self, mock_vector_store):
+    def test_format_results_header_format(self, search_tool):
         """Verify the formatted result contains proper headers."""
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute(query="test")
+        result = search_tool.execute(query="test")
 
         # Should contain header in format [Course Title - Lesson N]
         assert "[Test Course - Lesson 1]" in result
 
-    def test_tool_definition_format(self, mock_vector_store):
+    def test_tool_definition_format(self, search_tool):
         """Verify tool definition matches OpenAI function calling format."""
-        tool = CourseSearchTool(mock_vector_store)
-        definition = tool.get_tool_definition()
+        definition = search_tool.get_tool_definition()
 
         assert definition["type"] == "function"
         assert definition["function"]["name"] == "search_course_content"
         assert "parameters" in definition["function"]
         assert "query" in definition["function"]["parameters"]["properties"]
+
+
+class TestCourseSearchToolSemanticCache:
+    """Tests for the semantic cache in CourseSearchTool.execute()."""
+
+    @staticmethod
+    def _embed(text):
+        """Deterministic unit embeddings: 'what is X' and 'explain X' coincide."""
+        vectors = {
+            "what is caching": [1.0, 0.0],
+            "explain caching": [0.99, 0.141],
+            "lesson structure": [0.0, 1.0],
+        }
+        return np.asarray(vectors[text], dtype=np.float32)
+
+    def test_similar_query_served_from_cache(self, mock_vector_store):
+        """Paraphrased query above the threshold skips the vector store."""
+        mock_vector_store.embed = self._embed
+        tool = CourseSearchTool(mock_vector_store, cache_size=8)
+
+        first = tool.execute(query="what is caching")
+        tool.last_sources = []
+        second = tool.execute(query="explain caching")
+
+        assert first == second
+        assert len(mock_vector_store.search_calls) == 1
+        assert tool.last_sources[0]["label"] == "Test Course - Lesson 1"
+
+    def test_dissimilar_or_filtered_query_misses(self, mock_vector_store):
+        """Different meaning or different filters go to the vector store."""
+        mock_vector_store.embed = self._embed
+        tool = CourseSearchTool(mock_vector_store, cache_size=8)
+
+        tool.execute(query="what is caching")
+        tool.execute(query="lesson structure")
+        tool.execute(query="what is caching", lesson_number=2)
+        tool.execute(query="what is caching", no_cache=True)
+
+        assert len(mock_vector_store.search_calls) == 4
+
+    def test_cache_disabled_by_default(self, mock_vector_store):
+        """Without a cache size the store's embedding is never requested."""
+        # The stub store has no embed(), so requesting one would raise here
+        tool = CourseSearchTool(mock_vector_store)
+        tool.execute(query="test")
+        tool.execute(query="test")
+
+        assert len(mock_vector_store.search_calls) == 2
+
+
+class TestCourseOutlineToolCache:
+    """Tests for the outline TTL cache in CourseOutlineTool.execute()."""
+
+    @pytest.fixture
+    def outline_store(self, mock_vector_store):
+        mock_vector_store.course_catalog.get.return_value = {
+            "metadatas": [
+                {
+                    "course_link": "https://example.com/course",
+                    "lessons_json": '[{"lesson_number": 1, "lesson_title": "Intro"}]',
+                }
+            ]
+        }
+        return mock_vector_store
+
+    def test_repeat_outline_served_from_cache(self, outline_store):
+        """A second request for the same course skips the catalog lookup."""
+        tool = CourseOutlineTool(outline_store, cache_ttl=60)
+
+        first = tool.execute(course_name="Test")
+        tool.last_sources = []
+        second = tool.execute(course_name="Test")
+
+        assert first == second
+        assert "Lesson 1: Intro" in second
+        assert outline_store.course_catalog.get.call_count == 1
+        assert tool.last_sources[0]["label"] == "Test Course - Course Outline"
+
+    def test_course_update_invalidates_outline(self, outline_store):
+        """Re-ingesting a course drops its cached outline."""
+        tool = CourseOutlineTool(outline_store, cache_ttl=60)
+        (callback,) = outline_store.course_update_callbacks
+
+        tool.execute(course_name="Test")
+        callback("Test Course")
+        tool.execute(course_name="Test")
+
+        assert outline_store.course_catalog.get.call_count == 2
+
+
+class TestToolManagerArgumentValidation:
+    """Tests for ToolManager.parse_and_validate() against tool schemas."""
+
+    def test_valid_arguments_parsed(self, tool_manager):
+        """Well-formed arguments matching the schema are returned as a dict."""
+        arguments = tool_manager.parse_and_validate(
+            "search_course_content", '{"query": "caching", "lesson_number": 2}'
+        )
+        assert arguments == {"query": "caching", "lesson_number": 2}
+
+    @pytest.mark.parametrize(
+        "raw",
+        [
+            "{ invalid json }",
+            '["caching"]',
+            '{"course_name": "MCP"}',
+            '{"query": "caching", "lesson_number": "two"}',
+            '{"query": "caching", "lesson_number": true}',
+            '{"query": "caching", "page": 1}',
+        ],
+    )
+    def test_invalid_arguments_rejected(self, tool_manager, raw):
+        """Malformed JSON, missing, mistyped or unknown arguments raise."""
+        with pytest.raises(ValueError):
+            tool_manager.parse_and_validate("search_course_content", raw)
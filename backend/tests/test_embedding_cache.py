@@ -0,0 +1,82 @@
+"""
+Unit tests for the persistent EmbeddingCache and its use by VectorStore.embed().
+"""
+
+from unittest.mock import Mock, patch
+
+import numpy as np
+from embedding_cache import EmbeddingCache
+from vector_store import VectorStore
+
+
+class TestEmbeddingCache:
+    """Tests for EmbeddingCache get/set."""
+
+    def test_round_trip_and_misses(self, tmp_path):
+        """Stored vectors come back intact; unknown texts are None."""
+        cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), "model-a")
+        cache.set(["hello"], [np.array([0.5, 0.25], dtype=np.float32)])
+
+        hit, miss = cache.get(["hello", "world"])
+
+        np.testing.assert_array_equal(hit, [0.5, 0.25])
+        assert hit.dtype == np.float32
+        assert miss is None
+
+    def test_persists_across_instances(self, tmp_path):
+        """Entries survive reopening the same file, scoped by model name."""
+        path = str(tmp_path / "emb.sqlite3")
+        EmbeddingCache(path, "model-a").set(["hello"], [np.ones(2, np.float32)])
+
+        assert EmbeddingCache(path, "model-a").get(["hello"])[0] is not None
+        assert EmbeddingCache(path, "model-b").get(["hello"])[0] is None
+
+    def test_expired_entries_are_misses(self, tmp_path):
+        """Entries older than the TTL are not returned."""
+        cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), "model-a", ttl=60)
+        with patch("embedding_cache.time.time", return_value=1000.0):
+            cache.set(["hello"], [np.ones(2, np.float32)])
+        with patch("embedding_cache.time.time", return_value=1061.0):
+            assert cache.get(["hello"]) == [None]
+
+    def test_expired_rows_are_deleted(self, tmp_path):
+        """Expired rows are purged on open and on the next write after a TTL."""
+        path = str(tmp_path / "emb.sqlite3")
+        with patch("embedding_cache.time.time", return_value=1000.0):
+            EmbeddingCache(path, "model-a", ttl=60).set(
+                ["old"], [np.ones(2, np.float32)]
+            )
+        with patch("embedding_cache.time.time", return_value=1061.0):
+            reopened = EmbeddingCache(path, "model-a", ttl=60)
+            reopened.set(["new"], [np.ones(2, np.float32)])
+        with patch("embedding_cache.time.time", return_value=1122.0):
+            reopened.set(["newer"], [np.ones(2, np.float32)])
+
+        rows = reopened._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        assert rows == (1,)
+        assert reopened._conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    def test_closed_connection_falls_back_to_miss(self, tmp_path):
+        """Database errors are swallowed and reported as misses."""
+        cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), "model-a")
+        cache.close()
+
+        cache.set(["hello"], [np.ones(2, np.float32)])
+        assert cache.get(["hello"]) == [None]
+
+
+class TestVectorStoreEmbed:
+    """Tests for VectorStore.embed() with an embedding cache attached."""
+
+    def test_embed_uses_cache(self, tmp_path):
+        """The model runs once per text; repeats are served from the cache."""
+        store = VectorStore.__new__(VectorStore)
+        store.embedding_function = Mock(return_value=[[3.0, 4.0]])
+        store.embedding_cache = EmbeddingCache(str(tmp_path / "e.sqlite3"), "m")
+
+        first = store.embed("query")
+        second = store.embed("query")
+
+        np.testing.assert_allclose(first, [0.6, 0.8])
+        np.testing.assert_array_equal(first, second)
+        store.embedding_function.assert_called_once_with(["query"])
@@ -3,300 +3,207 @@ Integration tests for the RAG system.
 Tests the complete query flow and component integration.
 """
 
-import os
-import sys
-from unittest.mock import Mock, patch
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock, call
 
 import pytest
+from ai_generator import AIGenerator
+from rag_system import RAGSystem
+from tests._response_fixtures import (
+    StubAPIError,
+    text_response,
+    tool_call,
+    tool_call_response,
+)
+from vector_store import SearchResults
 
-# Add backend to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+async def _raise_api_error(*args, **kwargs):
+    """Stand-in for AIGenerator.generate_response_with_sources on API failure."""
+    raise StubAPIError("API Error")
 
 
 class TestRAGSystemInitialization:
     """Tests for RAG system initialization."""
 
-    def test_tool_manager_has_both_tools(self, mock_config):
+    def test_tool_manager_has_both_tools(self, patched_rag):
         """Both search and outline tools are registered on initialization."""
-        with (
-            patch("rag_system.VectorStore"),
-            patch("rag_system.AIGenerator"),
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            from rag_system import RAGSystem
+        rag = patched_rag.system
 
-            rag = RAGSystem(mock_config)
+        tools = rag.tool_manager.get_tool_definitions()
+        tool_names = {t["function"]["name"] for t in tools}
 
-            tools = rag.tool_manager.get_tool_definitions()
-            tool_names = [t["function"]["name"] for t in tools]
+        assert {"search_course_content", "get_course_outline"} <= tool_names
 
-            assert "search_course_content" in tool_names
-            assert "get_course_outline" in tool_names
-
-    def test_components_initialized_with_config(self, mock_config):
+    def test_components_initialized_with_config(self, patched_rag, mock_config):
         """All components receive correct configuration."""
-        with (
-            patch("rag_system.VectorStore") as mock_vs,
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor") as mock_dp,
-        ):
-
-            from rag_system import RAGSystem
-
-            RAGSystem(mock_config)
-
-            # Verify DocumentProcessor got chunk settings
-            mock_dp.assert_called_once_with(
-                mock_config.CHUNK_SIZE, mock_config.CHUNK_OVERLAP
-            )
-
-            # Verify VectorStore got path and model
-            mock_vs.assert_called_once_with(
+        # Verify DocumentProcessor got chunk settings
+        assert patched_rag.DocumentProcessor.call_args_list == [
+            call(mock_config.CHUNK_SIZE, mock_config.CHUNK_OVERLAP)
+        ]
+
+        # Verify VectorStore got path and model
+        assert patched_rag.VectorStore.call_args_list == [
+            call(
                 mock_config.CHROMA_PATH,
                 mock_config.EMBEDDING_MODEL,
                 mock_config.MAX_RESULTS,
+                None,  # Embedding cache disabled in the test config
             )
+        ]
 
-            # Verify AIGenerator got API key and model
-            mock_ai.assert_called_once_with(
-                mock_config.OPENAI_API_KEY, mock_config.OPENAI_MODEL
-            )
+        # Verify AIGenerator got API key and model
+        assert patched_rag.AIGenerator.call_args_list == [
+            call(mock_config.OPENAI_API_KEY, mock_config.OPENAI_MODEL)
+        ]
 
 
 class TestRAGSystemQuery:
     """Tests for RAG system query handling."""
 
-    def test_query_returns_answer_and_sources(self, mock_config):
-        """Full query flow returns response and sources."""
-        with (
-            patch("rag_system.VectorStore") as mock_vs,
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            mock_vs.return_value.search.return_value = Mock(
-                error=None,
-                documents=["content"],
-                metadata=[{"course_title": "Test", "lesson_number": 1}],
-                is_empty=lambda: False,
-            )
-            mock_vs.return_value.get_lesson_link.return_value = "http://example.com"
-            mock_ai.return_value.generate_response.return_value = "Answer"
+    def test_query_flow(self, patched_rag):
+        """
+        A query returns the answer and the sources of the tools used for it,
+        and hands the tools to the AI generator.
+        """
+        rag = patched_rag.system
+        generate = patched_rag.ai_generator.generate_response_with_sources
 
-            from rag_system import RAGSystem
+        # Stand in for sources recorded by a search during generation
+        found = [{"label": "Test", "link": "http://test.com"}]
+        generate.return_value = ("Answer", found)
 
-            rag = RAGSystem(mock_config)
+        answer, sources = asyncio.run(rag.query("test query", "session_1"))
 
-            answer, sources = rag.query("test query", "session_1")
+        assert answer == "Answer"
+        assert sources == found
 
-            assert answer == "Answer"
+        call_kwargs = generate.call_args.kwargs
+        assert call_kwargs["tools"] == rag.tool_manager.get_tool_definitions()
+        assert call_kwargs["tool_manager"] is rag.tool_manager
 
-    def test_query_creates_session_if_missing(self, mock_config):
+    def test_query_creates_session_if_missing(self, patched_rag):
         """Session is created when session_id not provided."""
-        with (
-            patch("rag_system.VectorStore"),
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            mock_ai.return_value.generate_response.return_value = "Answer"
-
-            from rag_system import RAGSystem
-
-            rag = RAGSystem(mock_config)
-
-            # Query without session_id
-            answer, sources = rag.query("test")
-
-            assert answer == "Answer"
-
-    def test_query_passes_tools_to_ai_generator(self, mock_config):
-        """Tool definitions are passed to AI generator."""
-        with (
-            patch("rag_system.VectorStore"),
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            mock_ai.return_value.generate_response.return_value = "Answer"
-
-            from rag_system import RAGSystem
-
-            rag = RAGSystem(mock_config)
-
-            rag.query("test", "session_1")
-
-            # Verify generate_response was called with tools
-            call_kwargs = mock_ai.return_value.generate_response.call_args.kwargs
-            assert "tools" in call_kwargs
-            assert "tool_manager" in call_kwargs
-
-    def test_sources_retrieved_after_query(self, mock_config):
-        """Sources are retrieved from tool manager after query."""
-        with (
-            patch("rag_system.VectorStore") as mock_vs,
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            mock_vs.return_value.search.return_value = Mock(
-                error=None,
-                documents=["content"],
-                metadata=[{"course_title": "Test", "lesson_number": 1}],
-                is_empty=lambda: False,
-            )
-            mock_vs.return_value.get_lesson_link.return_value = "http://example.com"
-            mock_ai.return_value.generate_response.return_value = "Answer"
-
-            from rag_system import RAGSystem
-
-            rag = RAGSystem(mock_config)
-
-            # Manually set sources to verify retrieval
-            rag.search_tool.last_sources = [
-                {"label": "Test", "link": "http://test.com"}
-            ]
+        rag = patched_rag.system
 
-            answer, sources = rag.query("test", "session_1")
+        # Query without session_id
+        answer, sources = asyncio.run(rag.query("test"))
 
-            # Sources should be returned (before reset)
-            # Note: The actual sources depend on whether tool was called
-            assert isinstance(sources, list)
-
-    def test_sources_reset_after_query(self, mock_config):
-        """Sources are reset after being retrieved."""
-        with (
-            patch("rag_system.VectorStore") as mock_vs,
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            mock_vs.return_value.search.return_value = Mock(
-                error=None,
-                documents=["content"],
-                metadata=[{"course_title": "Test", "lesson_number": 1}],
-                is_empty=lambda: False,
-            )
-            mock_vs.return_value.get_lesson_link.return_value = "http://example.com"
-            mock_ai.return_value.generate_response.return_value = "Answer"
+        assert answer == "Answer"
 
-            from rag_system import RAGSystem
-
-            rag = RAGSystem(mock_config)
-
-            # Set sources
-            rag.search_tool.last_sources = [
-                {"label": "Test", "link": "http://test.com"}
-            ]
-
-            rag.query("test", "session_1")
-
-            # Sources should be reset after query
-            assert rag.tool_manager.get_last_sources() == []
-
-    def test_query_with_conversation_history(self, mock_config):
+    def test_query_with_conversation_history(self, patched_rag):
         """Conversation history is passed to AI generator."""
-        with (
-            patch("rag_system.VectorStore"),
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            mock_ai.return_value.generate_response.return_value = "Answer"
-
-            from rag_system import RAGSystem
-
-            rag = RAGSystem(mock_config)
-
-            # Create session and add history
-            session_id = rag.session_manager.create_session()
-            rag.session_manager.add_exchange(
-                session_id, "previous question", "previous answer"
+        rag = patched_rag.system
+
+        # Query with a session that already has history
+        asyncio.run(rag.query("follow up question", patched_rag.history_session))
+
+        # Verify history was passed
+        generate = patched_rag.ai_generator.generate_response_with_sources
+        assert "previous question" in generate.call_args.kwargs["conversation_history"]
+
+    def test_concurrent_queries_keep_their_own_sources(
+        self, patched_rag, patched_openai, monkeypatch
+    ):
+        """Overlapping queries each get the sources of their own searches."""
+        rag = patched_rag.system
+        b_answered = asyncio.Event()
+
+        async def create(messages, **params):
+            topic = "A" if "topic A" in messages[-1]["content"] else "B"
+            if messages[-1]["role"] == "user":
+                arguments = json.dumps({"query": f"topic {topic}"})
+                return tool_call_response(tool_call(f"call_{topic}", arguments))
+            # A finishes last, after B's search and answer are complete
+            if topic == "A":
+                await b_answered.wait()
+            else:
+                b_answered.set()
+            return text_response(f"answer {topic}")
+
+        patched_openai.return_value = Mock(
+            **{"chat.completions.create": AsyncMock(side_effect=create)}
+        )
+        monkeypatch.setattr(rag, "ai_generator", AIGenerator("test-key", "model"))
+        monkeypatch.setattr(rag.search_tool, "cache_size", 0)
+        patched_rag.vector_store.search.side_effect = lambda query, **kwargs: (
+            SearchResults(
+                documents=[f"about {query}"],
+                metadata=[{"course_title": query}],
+                distances=[0.1],
             )
+        )
+        patched_rag.vector_store.get_lesson_links_batch.return_value = {}
 
-            # Query with existing session
-            rag.query("follow up question", session_id)
+        async def run_both():
+            return await asyncio.gather(
+                rag.query("explain topic A"), rag.query("explain topic B")
+            )
 
-            # Verify history was passed
-            call_kwargs = mock_ai.return_value.generate_response.call_args.kwargs
-            assert "conversation_history" in call_kwargs
+        assert asyncio.run(run_both()) == [
+            ("answer A", [{"label": "topic A", "link": None}]),
+            ("answer B", [{"label": "topic B", "link": None}]),
+        ]
 
 
 class TestRAGSystemErrorHandling:
     """Tests for error handling in RAG system."""
 
-    def test_ai_generator_error_propagates(self, mock_config):
+    def test_ai_generator_error_propagates(self, patched_rag):
         """Errors from AI generator propagate to caller."""
-        with (
-            patch("rag_system.VectorStore"),
-            patch("rag_system.AIGenerator") as mock_ai,
-            patch("rag_system.DocumentProcessor"),
-        ):
-
-            mock_ai.return_value.generate_response.side_effect = Exception("API Error")
-
-            from rag_system import RAGSystem
+        patched_rag.ai_generator.generate_response_with_sources = _raise_api_error
 
-            rag = RAGSystem(mock_config)
+        rag = patched_rag.system
 
-            with pytest.raises(Exception) as exc_info:
-                rag.query("test")
+        with pytest.raises(StubAPIError, match="API Error"):
+            asyncio.run(rag.query("test"))
 
-            assert "API Error" in str(exc_info.value)
-
-    def test_empty_config_api_key_behavior(self, mock_empty_config):
+    def test_empty_config_api_key_behavior(
+        self, mock_empty_config, patched_openai, monkeypatch
+    ):
         """
         Test behavior when OPENAI_API_KEY is empty.
-        The error should occur during the first API call.
+        The error is raised when the RAG system builds its AI generator.
         """
-        with patch("rag_system.VectorStore"), patch("rag_system.DocumentProcessor"):
-            # Don't mock AIGenerator - let it initialize with empty key
-            with patch("ai_generator.OpenAI") as mock_openai:
-                mock_client = Mock()
-                mock_client.chat.completions.create.side_effect = Exception(
-                    "Incorrect API key provided"
-                )
-                mock_openai.return_value = mock_client
-
-                from rag_system import RAGSystem
-
-                rag = RAGSystem(mock_empty_config)
+        monkeypatch.setattr("rag_system.VectorStore", Mock())
+        monkeypatch.setattr("rag_system.DocumentProcessor", Mock())
 
-                with pytest.raises(Exception) as exc_info:
-                    rag.query("test")
+        # Don't mock AIGenerator - let it validate the empty key
+        with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+            RAGSystem(mock_empty_config)
 
-                assert "API key" in str(exc_info.value)
+        patched_openai.assert_not_called()
 
 
 class TestRAGSystemDocumentLoading:
     """Tests for document loading functionality."""
 
-    def test_add_course_folder_initializes_vector_store(self, mock_config):
+    def test_add_course_folder_initializes_vector_store(self, patched_rag, tmp_path):
         """Adding courses populates the vector store."""
-        with (
-            patch("rag_system.VectorStore") as mock_vs,
-            patch("rag_system.AIGenerator"),
-            patch("rag_system.DocumentProcessor") as mock_dp,
-            patch("os.path.exists", return_value=True),
-            patch("os.listdir", return_value=["course.txt"]),
-            patch("os.path.isfile", return_value=True),
-        ):
-
-            # Mock document processing
-            mock_course = Mock()
-            mock_course.title = "Test Course"
-            mock_dp.return_value.process_course_document.return_value = (
-                mock_course,
-                [],
-            )
-            mock_vs.return_value.get_existing_course_titles.return_value = []
+        # A real folder with one course file; the processor itself is mocked
+        course_file = tmp_path / "course.txt"
+        course_file.touch()
+
+        # Mock document processing
+        mock_course = Mock()
+        mock_course.title = "Test Course"
+        patched_rag.document_processor.process_course_document.return_value = (
+            mock_course,
+            [],
+        )
+        patched_rag.vector_store.get_existing_course_titles.return_value = []
+
+        rag = patched_rag.system
 
-            from rag_system import RAGSystem
+        courses, chunks = rag.add_course_folder(str(tmp_path))
 
-            rag = RAGSystem(mock_config)
+        patched_rag.document_processor.process_course_document.assert_called_once_with(
+            str(course_file)
+        )
 
-            courses, chunks = rag.add_course_folder("/fake/path")
+        # Should add course metadata
+        patched_rag.vector_store.add_course_metadata.assert_called()
 
-            # Should add course metadata
-            mock_vs.return_value.add_course_metadata.assert_called()
+        # Cached answers may predate the new course
+        patched_rag.ai_generator.clear_response_cache.assert_called_once_with()
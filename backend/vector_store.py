@@ -1,8 +1,11 @@
+import json
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import chromadb
+import numpy as np
 from chromadb.config import Settings
+from embedding_cache import EmbeddingCache
 from models import Course, CourseChunk
 from sentence_transformers import SentenceTransformer
 
@@ -44,8 +47,18 @@ class SearchResults:
 class VectorStore:
     """Vector storage using ChromaDB for course content and metadata"""
 
-    def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5):
+    def __init__(
+        self,
+        chroma_path: str,
+        embedding_model: str,
+        max_results: int = 5,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
         self.max_results = max_results
+        # Optional persistent cache for query embeddings
+        self.embedding_cache = embedding_cache
+        # Callbacks notified with a course title when its catalog entry changes
+        self._course_update_listeners: List[Callable[[Optional[str]], None]] = []
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(
             path=chroma_path, settings=Settings(anonymized_telemetry=False)
@@ -66,6 +79,18 @@ class VectorStore:
             "course_content"
         )  # Actual course material
 
+    def on_course_updated(self, callback: Callable[[Optional[str]], None]):
+        """
+        Register a callback run when a course is (re-)ingested.
+
+        The callback receives the course title, or None when all data is cleared.
+        """
+        self._course_update_listeners.append(callback)
+
+    def _notify_course_updated(self, course_title: Optional[str]):
+        for callback in self._course_update_listeners:
+            callback(course_title)
+
     def _create_collection(self, name: str):
         """Create or get a ChromaDB collection"""
         return self.client.get_or_create_collection(
@@ -78,6 +103,7 @@ class VectorStore:
         course_name: Optional[str] = None,
         lesson_number: Optional[int] = None,
         limit: Optional[int] = None,
+        query_embedding: Optional[np.ndarray] = None,
     ) -> SearchResults:
         """
         Main search interface that handles course resolution and content search.
@@ -87,6 +113,7 @@ class VectorStore:
             course_name: Optional course name/title to filter by
             lesson_number: Optional lesson number to filter by
             limit: Maximum results to return
+            query_embedding: Precomputed embedding of query (skips re-embedding)
 
         Returns:
             SearchResults object with documents and metadata
@@ -106,17 +133,42 @@ class VectorStore:
         search_limit = limit if limit is not None else self.max_results
 
         try:
+            if query_embedding is not None:
+                query_args = {"query_embeddings": [query_embedding.tolist()]}
+            else:
+                query_args = self._query_args(query)
             results = self.course_content.query(
-                query_texts=[query], n_results=search_limit, where=filter_dict
+                **query_args, n_results=search_limit, where=filter_dict
             )
             return SearchResults.from_chroma(results)
         except Exception as e:
             return SearchResults.empty(f"Search error: {str(e)}")
 
+    def embed(self, text: str) -> np.ndarray:
+        """Embed text with the store's embedding model, L2-normalized"""
+        if self.embedding_cache is not None:
+            (cached,) = self.embedding_cache.get([text])
+            if cached is not None:
+                return cached
+
+        embedding = np.asarray(self.embedding_function([text])[0], dtype=np.float32)
+        embedding /= np.linalg.norm(embedding)
+        if self.embedding_cache is not None:
+            self.embedding_cache.set([text], [embedding])
+        return embedding
+
+    def _query_args(self, text: str) -> Dict[str, Any]:
+        """Chroma query arguments for text, using the embedding cache if enabled"""
+        if self.embedding_cache is None:
+            return {"query_texts": [text]}
+        return {"query_embeddings": [self.embed(text).tolist()]}
+
     def _resolve_course_name(self, course_name: str) -> Optional[str]:
         """Use vector search to find best matching course by name"""
         try:
-            results = self.course_catalog.query(query_texts=[course_name], n_results=1)
+            results = self.course_catalog.query(
+                **self._query_args(course_name), n_results=1
+            )
 
             if results["documents"][0] and results["metadatas"][0]:
                 # Return the title (which is now the ID)
@@ -149,8 +201,6 @@ class VectorStore:
 
     def add_course_metadata(self, course: Course):
         """Add course information to the catalog for semantic search"""
-        import json
-
         course_text = course.title
 
         # Build lessons metadata and serialize as JSON string
@@ -179,6 +229,7 @@ class VectorStore:
             ],
             ids=[course.title],
         )
+        self._notify_course_updated(course.title)
 
     def add_course_content(self, chunks: List[CourseChunk]):
         """Add course content chunks to the vector store"""
@@ -210,6 +261,7 @@ class VectorStore:
             # Recreate collections
             self.course_catalog = self._create_collection("course_catalog")
             self.course_content = self._create_collection("course_content")
+            self._notify_course_updated(None)
         except Exception as e:
             print(f"Error clearing data: {e}")
 
@@ -238,8 +290,6 @@ class VectorStore:
 
     def get_all_courses_metadata(self) -> List[Dict[str, Any]]:
         """Get metadata for all courses in the vector store"""
-        import json
-
         try:
             results = self.course_catalog.get()
             if results and "metadatas" in results:
@@ -272,10 +322,36 @@ class VectorStore:
             print(f"Error getting course link: {e}")
             return None
 
+    def get_lesson_links_batch(
+        self, pairs: Iterable[Tuple[str, int]]
+    ) -> Dict[Tuple[str, int], Optional[str]]:
+        """Get lesson links for many (course title, lesson number) pairs at once"""
+        pairs = set(pairs)
+        links = {pair: None for pair in pairs}
+        if not pairs:
+            return links
+
+        try:
+            # One catalog round-trip for every course referenced by the pairs
+            titles = list({course_title for course_title, _ in pairs})
+            results = self.course_catalog.get(ids=titles)
+            for course_title, metadata in zip(
+                results.get("ids") or [], results.get("metadatas") or []
+            ):
+                lessons_json = metadata.get("lessons_json")
+                if not lessons_json:
+                    continue
+                for lesson in json.loads(lessons_json):
+                    key = (course_title, lesson.get("lesson_number"))
+                    if key in links:
+                        links[key] = lesson.get("lesson_link")
+            return links
+        except Exception as e:
+            print(f"Error getting lesson links: {e}")
+            return links
+
     def get_lesson_link(self, course_title: str, lesson_number: int) -> Optional[str]:
         """Get lesson link for a given course title and lesson number"""
-        import json
-
         try:
             # Get course by ID (title is the ID)
             results = self.course_catalog.get(ids=[course_title])